@@ -0,0 +1,88 @@
+"""Measure end-to-end throughput of process_songs in each mode against the stub.
+
+    python bench/bench_e2e.py --rows 100 1000 --modes playlist like library sync --latency 0.02 --throttle 0.01
+
+Every run gets a fresh stub (and, in sync mode, a playlist that already holds
+half of the tracks), a fresh synthetic CSV and empty caches, so runs are
+comparable. Pass --recordings to replay responses captured with
+record_responses.py in front of the synthetic catalog.
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import convert  # noqa: E402
+from make_csv import write_csv  # noqa: E402
+from stub_server import StubServer, make_catalog  # noqa: E402
+
+
+def reset(args):
+    """Forget everything an earlier run learned"""
+    convert.track_details_cache.clear()
+    convert.album_tracks_cache.clear()
+    for memo in convert.lookup_memos:
+        memo.clear()
+    convert.equivalence_cache = convert.match_cache = convert.local_catalog = None
+    convert.workers = args.workers
+    for limiter in convert.rate_limiters.values():
+        # The stub is local, so lift the rate limits out of the way unless asked not to
+        limiter.rate = limiter.max_rate = args.rate
+        limiter.tokens = 1.0
+        limiter.blocked_until = 0.0
+        limiter.throttled = 0
+
+
+def run(args, catalog, mode, rows, directory):
+    path = write_csv(os.path.join(directory, f"bench_{mode}_{rows}.csv"), catalog, rows)
+    reset(args)
+    with StubServer(catalog=catalog, latency=args.latency, throttle=args.throttle, retry_after=args.retry_after,
+                    recordings=args.recordings) as stub:
+        stub.install(convert)
+        if mode == 'sync':
+            stub.playlists['p.seeded'] = {
+                'name': f"Bench {mode} {rows}".capitalize(),
+                'tracks': [song['id'] for song in catalog[:rows // 2]],
+            }
+        output = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output if not args.verbose else sys.stderr):
+            convert.process_songs(path, mode)
+        elapsed = time.perf_counter() - start
+        if args.verbose:
+            print(output.getvalue())
+        return elapsed, sum(stub.counts.values()), stub.counts['429']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--modes', nargs='+', default=['playlist', 'like', 'library', 'sync'],
+                        choices=['playlist', 'like', 'library', 'sync', 'match'])
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds the stub waits per request")
+    parser.add_argument('--throttle', type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument('--retry-after', type=float, default=0, help="Retry-After of the injected 429s")
+    parser.add_argument('--rate', type=float, default=1e6, help="requests per second allowed by the rate limiters")
+    parser.add_argument('--workers', type=int, default=convert.workers)
+    parser.add_argument('--engine', choices=['requests', 'async'], default=convert.engine)
+    parser.add_argument('--recordings', help="JSON lines of recorded responses to replay")
+    parser.add_argument('--verbose', action='store_true', help="show the converter's own output")
+    args = parser.parse_args()
+
+    convert.engine = args.engine
+    catalog = make_catalog(max(args.rows))
+    print(f"{'mode':>8} {'rows':>7} {'seconds':>8} {'rows/s':>8} {'requests':>9} {'429s':>6}")
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in args.modes:
+            for rows in args.rows:
+                elapsed, requests_sent, throttled = run(args, catalog, mode, rows, directory)
+                print(f"{mode:>8} {rows:>7} {elapsed:>8.2f} {rows / elapsed:>8.1f} {requests_sent:>9} {throttled:>6}")
+
+
+if __name__ == '__main__':
+    main()
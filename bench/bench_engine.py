@@ -0,0 +1,63 @@
+"""Compare the requests and async HTTP engines against the local stub server.
+
+    python bench/bench_engine.py --requests 500 --workers 16 --latency 0.05
+
+Every request goes through the same code path the converter uses (rate
+limiter, retries, session headers); only the transport differs.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import convert  # noqa: E402
+from stub_server import StubServer  # noqa: E402
+
+
+def run(engine, stub, count, workers):
+    convert.engine = engine
+    song_ids = [song['id'] for song in stub.catalog[:count]]
+    # Details are cached for the run, so each engine starts from nothing
+    convert.track_details_cache.clear()
+    sent = sum(stub.counts.values())
+    start = time.perf_counter()
+    with convert.make_session() as session:
+        session.headers.update({"Authorization": convert.token})
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # One song per call, so there is a request per song for the engines to overlap
+            results = list(executor.map(
+                lambda song_id: convert.get_tracks_details([song_id], session).get(song_id), song_ids
+            ))
+    elapsed = time.perf_counter() - start
+    found = sum(1 for result in results if result)
+    return elapsed, found, sum(stub.counts.values()) - sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds the stub waits per request")
+    args = parser.parse_args()
+
+    # The stub is local, so lift the rate limits out of the way
+    for limiter in convert.rate_limiters.values():
+        limiter.rate = limiter.max_rate = 1e6
+    convert.host_concurrency = args.workers
+
+    with StubServer(latency=args.latency) as stub:
+        stub.install(convert)
+        engines = ['requests'] + (['async'] if convert.httpx_available else [])
+        for engine in engines:
+            elapsed, found, sent = run(engine, stub, args.requests, args.workers)
+            print(f"{engine:>8}: {sent} requests in {elapsed:.2f}s "
+                  f"({sent / elapsed:.0f} req/s, {found} found)")
+        if not convert.httpx_available:
+            print("   async: skipped, install httpx to compare")
+
+
+if __name__ == '__main__':
+    main()
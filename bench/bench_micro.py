@@ -0,0 +1,86 @@
+"""Micro-benchmark the CPU-bound matching helpers.
+
+    python bench/bench_micro.py --number 2000
+
+Times clean_string (memoized and not), get_string_similarity and
+enhance_itunes_match on synthetic search results. Catalog details are fetched
+from the stub once up front, so enhance_itunes_match is timed without network.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import convert  # noqa: E402
+from bench_normalize import make_rows  # noqa: E402
+from stub_server import StubServer, make_catalog  # noqa: E402
+
+
+def report(name, seconds, number):
+    print(f"{name:>32}: {seconds / number * 1e6:8.1f} us/call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=2000, help="calls per benchmark")
+    args = parser.parse_args()
+
+    catalog = make_catalog(5000)
+    rows = make_rows(catalog, args.number)
+    titles = [row[1] for row, _ in rows]
+    pairs = [(row[1], results[0]['trackName']) for row, results in rows]
+
+    def cycle(items):
+        state = {'index': 0}
+        def next_item():
+            state['index'] = (state['index'] + 1) % len(items)
+            return items[state['index']]
+        return next_item
+
+    next_title = cycle(titles)
+    report("clean_string (not memoized)", timeit.timeit(lambda: convert.clean_string.__wrapped__(next_title()),
+                                                       number=args.number), args.number)
+    for title in titles:
+        convert.clean_string(title)
+    report("clean_string (memoized)", timeit.timeit(lambda: convert.clean_string(next_title()),
+                                                   number=args.number), args.number)
+
+    for backend in ['difflib'] + (['rapidfuzz'] if convert.rapidfuzz_available else []):
+        convert.similarity_backend = backend
+        next_pair = cycle(pairs)
+        report(f"get_string_similarity ({backend})",
+               timeit.timeit(lambda: convert.get_string_similarity(*next_pair()), number=args.number), args.number)
+
+    # Search results shaped like the iTunes API's, for songs the stub knows
+    searches = []
+    for index, (row, results) in enumerate(rows[:200]):
+        # The row's own song among others, the way a search would find it
+        songs = [catalog[int(row[16][5:])]] + [catalog[(index * 10 + offset) % len(catalog)] for offset in range(9)]
+        searches.append((row, [{
+            'trackId': int(song['id']),
+            'trackName': song['attributes']['name'],
+            'artistName': song['attributes']['artistName'],
+            'collectionName': song['attributes']['albumName'],
+        } for song in songs]))
+
+    with StubServer(catalog=catalog) as stub:
+        stub.install(convert)
+        for limiter in convert.rate_limiters.values():
+            limiter.rate = limiter.max_rate = 1e6
+        with convert.make_session() as session:
+            # Warm the details cache, so only matching is timed
+            for row, results in searches:
+                convert.get_tracks_details([result['trackId'] for result in results], session)
+            for backend in ['difflib'] + (['rapidfuzz'] if convert.rapidfuzz_available else []):
+                convert.similarity_backend = backend
+                next_search = cycle(searches)
+                def enhance():
+                    row, results = next_search()
+                    return convert.enhance_itunes_match(results, row[1], row[3], row[5], session)
+                report(f"enhance_itunes_match ({backend})", timeit.timeit(enhance, number=args.number), args.number)
+
+
+if __name__ == '__main__':
+    main()
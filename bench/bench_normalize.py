@@ -0,0 +1,166 @@
+"""Measure the per-row CPU cost of string normalization and result scoring.
+
+    python bench/bench_normalize.py --rows 5000
+
+Compares the original normalization (one re.sub per pattern, every string
+cleaned again before each comparison) with the current one (precompiled
+single-pass patterns, memoized, each string normalized once), and checks
+that both produce the same strings and scores on the synthetic catalog.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from difflib import SequenceMatcher
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import convert  # noqa: E402
+from stub_server import make_catalog  # noqa: E402
+
+DECORATIONS = [
+    "", " (feat. {artist})", " (Remastered 2011)", " - Official Music Video", " (with {artist})",
+    " featuring {artist}", " (Lyric Video)", " - Radio Version", " (Official Audio)", " ft. {artist}",
+]
+
+
+def legacy_clean_string(s):
+    if not s:
+        return ""
+    s = re.sub(r'[^\w\s]', ' ', s.lower())
+    removals = [
+        r'\b(official\s+)?(music\s+)?video\b',
+        r'\b(official\s+)?(audio)\b',
+        r'\b(official\s+)?(lyric\s+video)\b',
+        r'\bofficial\b',
+        r'\blyrics\b',
+        r'\bremix\b',
+        r'\bver(\.|sion)?\b',
+        r'\bremaster(ed)?\b'
+    ]
+    for pattern in removals:
+        s = re.sub(pattern, '', s, flags=re.IGNORECASE)
+    return ' '.join(s.split())
+
+
+def legacy_remove_features(title):
+    if not title:
+        return ""
+    patterns = [
+        r'\(feat\..*?\)',
+        r'\(ft\..*?\)',
+        r'\(featuring.*?\)',
+        r'\(with.*?\)',
+        r'\bfeat\..*?(?=\s|$|\()',
+        r'\bft\..*?(?=\s|$|\()',
+        r'\bfeaturing.*?(?=\s|$|\()',
+        r'\bwith\s+(?:[^()]+)(?=\s|$|\()'
+    ]
+    for pattern in patterns:
+        title = re.sub(pattern, '', title, flags=re.IGNORECASE)
+    return title.strip()
+
+
+def legacy_similarity(str1, str2):
+    if not str1 or not str2:
+        return 0
+    return SequenceMatcher(None, legacy_clean_string(str1), legacy_clean_string(str2)).ratio()
+
+
+def legacy_row(row, results):
+    """What matching a row cost before: clean the fields, then clean again per comparison"""
+    title, artist, album = [legacy_clean_string(x) for x in [row[1], row[3], row[5], row[7], row[16]]][:3]
+    search_title = legacy_clean_string(legacy_remove_features(title))
+    search_artist = legacy_clean_string(artist)
+    search_album = legacy_clean_string(album)
+    scored = []
+    for result in results:
+        total = (legacy_similarity(search_title, legacy_clean_string(legacy_remove_features(result['trackName']))) * 0.5
+                 + legacy_similarity(search_artist, legacy_clean_string(result['artistName'])) * 0.3
+                 + legacy_similarity(search_album, legacy_clean_string(result['collectionName'])) * 0.2)
+        scored.append((total, result))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return scored
+
+
+def current_row(index, row, results):
+    record = convert.NormalizedTrack(index, row[0], row[1], row[3], row[5], row[7], row[16])
+    return convert.score_search_results(results, record.title, record.artist, record.album)
+
+
+def make_rows(catalog, count, seed=1):
+    """CSV rows for random catalog songs, decorated like real exports, with 10 search results each
+    
+    One of the results is the song itself, decorated differently, the others are random songs.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for index in range(count):
+        song = rng.choice(catalog)['attributes']
+        other = rng.choice(catalog)['attributes']
+        title = song['name'] + rng.choice(DECORATIONS).format(artist=other['artistName'])
+        row = [f"spotify:track:{index}", title, '', song['artistName'], '', song['albumName'], '',
+               song['artistName']] + [''] * 8 + [song['isrc']]
+        candidates = [rng.choice(catalog)['attributes'] for _ in range(9)]
+        candidates.insert(rng.randrange(10), song)
+        results = [{
+            'trackName': candidate['name'] + rng.choice(DECORATIONS).format(artist=song['artistName']),
+            'artistName': candidate['artistName'],
+            'collectionName': candidate['albumName'],
+        } for candidate in candidates]
+        rows.append((row, results))
+    return rows
+
+
+def check_equivalence(rows):
+    """Count strings and scores where the current normalization differs from the original"""
+    strings = set()
+    for row, results in rows:
+        strings.update([row[1], row[3], row[5]])
+        strings.update(result['trackName'] for result in results)
+    cleaned = sum(1 for text in strings if convert.clean_string(text) != legacy_clean_string(text))
+    featured = sum(1 for text in strings if convert.remove_features(text) != legacy_remove_features(text))
+    scores = 0
+    for index, (row, results) in enumerate(rows):
+        old = [round(score, 9) for score, _ in legacy_row(row, results)]
+        new = [round(score, 9) for score, _ in current_row(index, row, results)]
+        scores += old != new
+    return len(strings), cleaned, featured, scores
+
+
+def time_rows(name, rows, match_row):
+    start = time.process_time()
+    for index, (row, results) in enumerate(rows):
+        match_row(index, row, results)
+    elapsed = time.process_time() - start
+    print(f"{name:>16}: {elapsed:.2f}s CPU, {elapsed / len(rows) * 1e6:.0f} us/row")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--catalog', type=int, default=20000, help="synthetic catalog size")
+    args = parser.parse_args()
+
+    rows = make_rows(make_catalog(args.catalog), args.rows)
+    # Scores are compared exactly, so use the scorer the original code used
+    convert.similarity_backend = 'difflib'
+
+    strings, cleaned, featured, scores = check_equivalence(rows)
+    print(f"Equivalence: {strings} distinct strings, {cleaned} clean_string and {featured} "
+          f"remove_features differences, {scores}/{len(rows)} rows scored differently")
+
+    legacy = time_rows("original", rows, lambda index, row, results: legacy_row(row, results))
+    convert.clean_string.cache_clear()
+    convert.remove_features.cache_clear()
+    cold = time_rows("current (cold)", rows, current_row)
+    warm = time_rows("current (warm)", rows, current_row)
+    print(f"Speedup: {legacy / cold:.1f}x cold, {legacy / warm:.1f}x with a warm memo")
+    print(f"clean_string memo: {convert.clean_string.cache_info()}")
+
+
+if __name__ == '__main__':
+    main()
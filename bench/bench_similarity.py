@@ -0,0 +1,76 @@
+"""Compare the string similarity backends on search-result scoring.
+
+    python bench/bench_similarity.py --rows 5000
+
+Scores every row of a synthetic export against its search results with each
+available backend, reporting CPU cost and how far the scores and match
+decisions drift from difflib, the reference.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import convert  # noqa: E402
+from bench_normalize import make_rows  # noqa: E402
+from stub_server import make_catalog  # noqa: E402
+
+
+def score_rows(backend, rows, records):
+    """Return the CPU time and the scored results of every row with a backend"""
+    convert.similarity_backend = backend
+    start = time.process_time()
+    scored = [
+        convert.score_search_results(results, record.title, record.artist, record.album)
+        for record, (_, results) in zip(records, rows)
+    ]
+    return time.process_time() - start, scored
+
+
+def compare(reference, scored, threshold=0.8):
+    """Largest score difference near the threshold, and how many decisions changed"""
+    largest = 0
+    decisions = 0
+    best = 0
+    for expected, actual in zip(reference, scored):
+        expected_scores = {id(result): score for score, result in expected}
+        for score, result in actual:
+            reference_score = expected_scores[id(result)]
+            if max(score, reference_score) >= threshold - 0.1:
+                largest = max(largest, abs(score - reference_score))
+            decisions += (score >= threshold) != (reference_score >= threshold)
+        best += expected[0][1] is not actual[0][1] and expected[0][0] != actual[0][0]
+    return largest, decisions, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--catalog', type=int, default=20000, help="synthetic catalog size")
+    args = parser.parse_args()
+
+    rows = make_rows(make_catalog(args.catalog), args.rows)
+    records = [
+        convert.NormalizedTrack(index, row[0], row[1], row[3], row[5], row[7], row[16])
+        for index, (row, _) in enumerate(rows)
+    ]
+    # Warm the normalization memo so only the scoring is measured
+    score_rows('difflib', rows, records)
+
+    reference_time, reference = score_rows('difflib', rows, records)
+    print(f"{'difflib':>10}: {reference_time:.2f}s CPU, {reference_time / len(rows) * 1e6:.0f} us/row")
+    if not convert.rapidfuzz_available:
+        print(" rapidfuzz: skipped, install rapidfuzz to compare")
+        return
+    elapsed, scored = score_rows('rapidfuzz', rows, records)
+    largest, decisions, best = compare(reference, scored)
+    print(f"{'rapidfuzz':>10}: {elapsed:.2f}s CPU, {elapsed / len(rows) * 1e6:.0f} us/row "
+          f"({reference_time / elapsed:.1f}x faster)")
+    print(f"Drift from difflib: at most {largest:.3f} for scores near 0.8, "
+          f"{decisions} match decisions and {best}/{len(rows)} best results changed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Check that sync mode with --remove-missing never removes a track still in the CSV.
+
+    python bench/check_sync.py --rows 200
+
+Converts a synthetic CSV to a playlist, cuts the CSV in half and syncs it with
+remove_missing, against the stub. Exits with status 1 if a track whose row is
+still in the CSV was removed, or if, with every row matched, the tracks of the
+cut rows were not all removed.
+"""
+import argparse
+import contextlib
+import csv
+import io
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import convert  # noqa: E402
+from make_csv import write_csv  # noqa: E402
+from stub_server import StubServer, make_catalog  # noqa: E402
+
+
+def reset():
+    """Forget everything an earlier run learned"""
+    convert.track_details_cache.clear()
+    convert.album_tracks_cache.clear()
+    for memo in convert.lookup_memos:
+        memo.clear()
+    convert.equivalence_cache = convert.match_cache = convert.local_catalog = None
+    for limiter in convert.rate_limiters.values():
+        limiter.rate = limiter.max_rate = 1e6
+
+
+def check(catalog, rows, directory, name, **csv_options):
+    """Run the scenario on one CSV, returning a list of problems"""
+    path = write_csv(os.path.join(directory, f"{name}.csv"), catalog, rows, **csv_options)
+    output = io.StringIO()
+    with StubServer(catalog=catalog) as stub, contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        stub.install(convert)
+        reset()
+        convert.remove_missing = False
+        convert.process_songs(path, 'playlist')
+        playlist = next(iter(stub.playlists.values()))
+        before = list(playlist['tracks'])
+        with open(path, encoding='utf-8', newline='') as csvfile:
+            lines = list(csv.reader(csvfile))
+        with open(path, 'w', encoding='utf-8', newline='') as csvfile:
+            csv.writer(csvfile).writerows(lines[:1 + rows // 2])
+
+        # Tracks the first run added for the rows that stay in the CSV
+        with open(f"{os.path.splitext(path)[0]}_playlist.journal", encoding='utf-8') as journal:
+            entries = [convert.json.loads(line) for line in journal]
+        kept = {
+            str(entry['track'].get('equivalent_id') or entry['track']['track_id'])
+            for entry in entries if entry['row'] <= rows // 2 and entry['result'] == "OK"
+        }
+        reset()
+        convert.remove_missing = True
+        summary = convert.process_songs(path, 'sync')
+        after = set(playlist['tracks'])
+
+    problems = [f"{name}: removed {song_id}, whose row is still in the CSV" for song_id in sorted(kept - after)]
+    if not summary['failed'] and after != kept:
+        problems.append(f"{name}: every row matched, yet {len(after - kept)} tracks of cut rows were kept")
+    print(f"{name}: {len(before)} tracks, {summary['failed']} rows failed in sync, {len(before) - len(after)} removed")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200)
+    args = parser.parse_args()
+
+    catalog = make_catalog(args.rows * 2)
+    with tempfile.TemporaryDirectory() as directory:
+        problems = check(catalog, args.rows, directory, 'unmatched_rows')
+        problems += check(catalog, args.rows, directory, 'all_matched', no_isrc=0, missing=0)
+    for problem in problems:
+        print(problem)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
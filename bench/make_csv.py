@@ -0,0 +1,64 @@
+"""Write synthetic Exportify CSVs of the stub server's catalog.
+
+    python bench/make_csv.py 100 1000 10000 50000 --out bench/data
+
+Each file is named tracks_<rows>.csv. Titles get the decorations real exports
+have (features, remasters, versions), a share of rows has no ISRC so they go
+through the text search, and a share is not in the catalog at all.
+"""
+import argparse
+import csv
+import os
+import random
+
+from stub_server import make_catalog
+
+HEADER = [
+    'Track URI', 'Track Name', 'Artist URI(s)', 'Artist Name(s)', 'Album URI', 'Album Name',
+    'Album Artist URI(s)', 'Album Artist Name(s)', 'Album Release Date', 'Album Image URL', 'Disc Number',
+    'Track Number', 'Track Duration (ms)', 'Track Preview URL', 'Explicit', 'Popularity', 'ISRC',
+    'Added By', 'Added At',
+]
+
+DECORATIONS = ["", "", "", " (feat. {artist})", " - Remastered 2011", " (Radio Version)", " (with {artist})"]
+
+
+def write_csv(path, catalog, rows, seed=1, no_isrc=0.25, missing=0.05):
+    """Write rows tracks drawn from catalog (in catalog order, wrapping around) to path"""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(HEADER)
+        for index in range(rows):
+            attributes = catalog[index % len(catalog)]['attributes']
+            title = attributes['name'] + rng.choice(DECORATIONS).format(artist=rng.choice(catalog)['attributes']['artistName'])
+            isrc = attributes['isrc']
+            if rng.random() < missing:
+                title = f"Unreleased Demo {index}"
+                isrc = f"ZZMIS{index:07d}"
+            elif rng.random() < no_isrc:
+                isrc = ''
+            writer.writerow([
+                f"spotify:track:{index:022d}", title, '', attributes['artistName'], '', attributes['albumName'],
+                '', attributes['artistName'], attributes['releaseDate'], '', '1', attributes['trackNumber'],
+                attributes['durationInMillis'], '', str(attributes['contentRating'] == 'explicit').lower(),
+                rng.randint(0, 100), isrc, '', '',
+            ])
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('rows', type=int, nargs='+', help="number of rows of each file")
+    parser.add_argument('--out', default='.', help="directory the files are written to")
+    parser.add_argument('--catalog', type=int, default=None, help="catalog size (default: the largest row count)")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    catalog = make_catalog(args.catalog or max(args.rows))
+    for rows in args.rows:
+        print(write_csv(os.path.join(args.out, f"tracks_{rows}.csv"), catalog, rows))
+
+
+if __name__ == '__main__':
+    main()
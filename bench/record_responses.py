@@ -0,0 +1,66 @@
+"""Record live Apple Music and iTunes Search responses for the stub server to replay.
+
+    python bench/record_responses.py playlist.csv recordings.jsonl
+
+Matches every track of the CSV against the live APIs, with the credentials of
+the .dat files convert.py uses, and writes each response as a JSON line. Only
+lookups are sent: nothing is added to the library or any playlist. Replay the
+file with StubServer(recordings=...) or bench_e2e.py --recordings.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import convert  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('csv', help="an Exportify CSV file")
+    parser.add_argument('output', help="JSON lines file the responses are appended to")
+    args = parser.parse_args()
+
+    convert.token = convert.get_connection_data("token.dat", "\nPlease enter your Apple Music Authorization (Bearer token):\n")
+    convert.media_user_token = convert.get_connection_data("media_user_token.dat", "\nPlease enter your media user token:\n")
+    convert.cookies = convert.get_connection_data("cookies.dat", "\nPlease enter your cookies:\n")
+    convert.country_code = convert.get_connection_data("country_code.dat", "\nPlease enter the country code (e.g., DE, UK, US etc.): ")
+
+    lock = threading.Lock()
+    output = open(args.output, 'a', encoding='utf-8')
+    send_limited = convert.send_limited
+
+    def recording_send_limited(method, url, send):
+        response = send_limited(method, url, send)
+        parsed = urllib.parse.urlparse(url)
+        try:
+            body = json.loads(response.content.decode('utf-8')) if response.content else None
+        except ValueError:
+            return response
+        entry = {'method': method, 'url': urllib.parse.urlunparse(('', '', parsed.path, '', parsed.query, '')),
+                 'status': response.status_code, 'body': body}
+        with lock:
+            output.write(json.dumps(entry) + '\n')
+        return response
+
+    # Both engines look send_limited up at call time
+    convert.send_limited = recording_send_limited
+
+    with convert.open_session() as session, open(args.csv, encoding='utf-8', newline='') as csvfile:
+        track_reader = convert.TrackReader(csvfile)
+        if not track_reader.is_valid():
+            sys.exit("The CSV file needs at least a track name and an artist name column")
+        for records in convert.read_in_chunks(track_reader.tracks(), convert.lookahead_rows):
+            isrc_candidates = convert.fetch_isrc_candidates(session, [record.isrc for record in records])
+            for record in records:
+                track, track_id = convert.match_track(session, record, isrc_candidates, {})
+                print(f"{track['title']} by {track['artist']}: {track_id or 'not found'}")
+    output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+"""Local stand-in for the Apple Music (amp-api) and iTunes Search APIs.
+
+Serves a deterministic synthetic catalog so convert.py can be exercised and
+benchmarked offline, without Apple credentials:
+
+    with StubServer(latency=0.05) as stub:
+        stub.install(convert)
+        convert.process_songs("playlist.csv", "playlist")
+        print(stub.counts)
+
+Responses recorded from the live APIs with record_responses.py are replayed
+before the synthetic catalog is consulted, and a share of requests can be
+answered with 429 to exercise the rate limiters.
+"""
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = [
+    "love", "night", "summer", "heart", "fire", "blue", "dream", "gold", "rain", "city",
+    "light", "river", "shadow", "wild", "sky", "echo", "stone", "silver", "moon", "road",
+    "ocean", "storm", "dance", "home", "glass", "paper", "neon", "velvet", "winter", "sugar",
+]
+
+
+def make_catalog(size=2000, seed=1):
+    """Build a list of catalog songs shaped like amp-api song resources"""
+    rng = random.Random(seed)
+    artists = [f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}" for _ in range(max(1, size // 40))]
+    songs = []
+    album_index = 0
+    while len(songs) < size:
+        artist = rng.choice(artists)
+        album = f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {album_index}"
+        release_date = f"{rng.randint(1970, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        album_index += 1
+        for track_number in range(1, rng.randint(6, 14) + 1):
+            if len(songs) == size:
+                break
+            index = len(songs)
+            songs.append({
+                'id': str(1000000000 + index),
+                'type': 'songs',
+                'attributes': {
+                    'name': f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {index}",
+                    'artistName': artist,
+                    'albumName': album,
+                    'isrc': f"USSTB{index:07d}",
+                    'durationInMillis': rng.randint(120000, 360000),
+                    'contentRating': 'explicit' if rng.random() < 0.1 else None,
+                    'trackNumber': track_number,
+                    'releaseDate': release_date,
+                    'previews': [{'url': f"https://example.invalid/preview/{index}.m4a"}],
+                    'artwork': {'url': f"https://example.invalid/artwork/{index}.jpg"},
+                },
+            })
+    return songs
+
+
+def tokenize(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def recording_key(method, path, query):
+    return (method, path, tuple(sorted(query.items())))
+
+
+def load_recordings(path):
+    """Read the JSON lines written by record_responses.py into {key: (status, body)}"""
+    recordings = {}
+    with open(path, encoding='utf-8') as lines:
+        for line in lines:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            parsed = urllib.parse.urlparse(entry['url'])
+            query = {key: values[0] for key, values in urllib.parse.parse_qs(parsed.query).items()}
+            recordings[recording_key(entry['method'], parsed.path, query)] = (entry['status'], entry['body'])
+    return recordings
+
+
+class StubServer:
+    """Threaded HTTP server that answers the requests convert.py sends"""
+
+    def __init__(self, catalog=None, latency=0.0, host='127.0.0.1', port=0, throttle=0.0, retry_after=0,
+                 recordings=None, seed=1):
+        self.catalog = catalog if catalog is not None else make_catalog()
+        self.latency = latency
+        # Share of requests answered with 429, and the Retry-After they carry
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.recordings = load_recordings(recordings) if recordings else {}
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.by_id = {song['id']: song for song in self.catalog}
+        self.by_isrc = defaultdict(list)
+        self.index = defaultdict(set)
+        # Albums are derived from the songs' album names, with their tracks in catalog order
+        self.albums = {}
+        album_ids = {}
+        self.album_index = defaultdict(set)
+        for song in self.catalog:
+            attributes = song['attributes']
+            self.by_isrc[attributes['isrc']].append(song)
+            for token in tokenize(f"{attributes['name']} {attributes['artistName']} {attributes['albumName']}"):
+                self.index[token].add(song['id'])
+            album_key = (attributes['albumName'], attributes['artistName'])
+            if album_key not in album_ids:
+                album_id = album_ids[album_key] = str(1500000000 + len(album_ids))
+                self.albums[album_id] = {
+                    'id': album_id,
+                    'type': 'albums',
+                    'attributes': {'name': album_key[0], 'artistName': album_key[1], 'releaseDate': attributes['releaseDate']},
+                    'tracks': [],
+                }
+                for token in tokenize(f"{album_key[0]} {album_key[1]}"):
+                    self.album_index[token].add(album_id)
+            self.albums[album_ids[album_key]]['tracks'].append(song)
+        self.playlists = {}
+        self.ratings = {}
+        self.library = set()
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def install(self, convert, country_code='us'):
+        """Point a loaded convert module at this server with dummy credentials"""
+        convert.amp_api_url = self.url
+        convert.itunes_search_url = f"{self.url}/search"
+        convert.token = "Bearer stub"
+        convert.media_user_token = "stub"
+        convert.cookies = "stub=1"
+        convert.country_code = country_code
+
+    # Request handling
+
+    def make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def handle_method(self, method):
+                parsed = urllib.parse.urlparse(self.path)
+                query = {key: values[0] for key, values in urllib.parse.parse_qs(parsed.query).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'null') if length else None
+                if stub.latency:
+                    time.sleep(stub.latency)
+                with stub.lock:
+                    throttled = stub.throttle and stub.rng.random() < stub.throttle
+                if throttled:
+                    endpoint, status, payload = '429', 429, {'errors': [{'status': '429', 'title': 'Too Many Requests'}]}
+                elif recording_key(method, parsed.path, query) in stub.recordings:
+                    status, payload = stub.recordings[recording_key(method, parsed.path, query)]
+                    endpoint = 'recorded'
+                else:
+                    endpoint, status, payload = stub.route(method, parsed.path, query, body)
+                with stub.lock:
+                    stub.counts[endpoint] += 1
+                data = json.dumps(payload).encode('utf-8') if payload is not None else b''
+                self.send_response(status)
+                if throttled:
+                    self.send_header('Retry-After', str(stub.retry_after))
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self.handle_method('GET')
+
+            def do_POST(self):
+                self.handle_method('POST')
+
+            def do_PUT(self):
+                self.handle_method('PUT')
+
+            def do_DELETE(self):
+                self.handle_method('DELETE')
+
+        return Handler
+
+    def route(self, method, path, query, body):
+        """Return (endpoint name, status, JSON payload) for a request"""
+        if path == '/search':
+            return 'search', 200, self.search(query)
+
+        if re.fullmatch(r'/v1/catalog/\w+/search', path) and method == 'GET':
+            return 'catalog search', 200, self.catalog_search(query)
+
+        match = re.fullmatch(r'/v1/catalog/\w+/songs', path)
+        if match and method == 'GET':
+            if 'filter[isrc]' in query:
+                isrcs = query['filter[isrc]'].upper().split(',')
+                return 'songs?filter[isrc]', 200, {'data': [song for isrc in isrcs for song in self.by_isrc.get(isrc, [])]}
+            if 'filter[equivalents]' in query:
+                ids = query['filter[equivalents]'].split(',')
+                return 'songs?filter[equivalents]', 200, {'data': [self.by_id[song_id] for song_id in ids if song_id in self.by_id]}
+            if 'ids' in query:
+                ids = query['ids'].split(',')
+                return 'songs?ids', 200, {'data': [self.by_id[song_id] for song_id in ids if song_id in self.by_id]}
+
+        match = re.fullmatch(r'/v1/catalog/\w+/albums/(\w+)/tracks', path)
+        if match and method == 'GET':
+            album = self.albums.get(match.group(1))
+            if album is None:
+                return 'albums/{id}/tracks', 404, {'errors': []}
+            return 'albums/{id}/tracks', 200, self.paginate(path, query, album['tracks'], max_limit=300)
+
+        match = re.fullmatch(r'/v1/catalog/\w+/songs/(\w+)', path)
+        if match and method == 'GET':
+            song = self.by_id.get(match.group(1))
+            return 'songs/{id}', (200 if song else 404), {'data': [song] if song else []}
+
+        if path == '/v1/me/library/playlists':
+            if method == 'POST':
+                playlist_id = f"p.stub{len(self.playlists)}"
+                self.playlists[playlist_id] = {'name': body['attributes']['name'], 'tracks': []}
+                return 'library/playlists POST', 201, {'data': [{'id': playlist_id}]}
+            return 'library/playlists', 200, self.paginate(path, query, [
+                {'id': playlist_id, 'attributes': {'name': playlist['name']}}
+                for playlist_id, playlist in self.playlists.items()
+            ])
+
+        match = re.fullmatch(r'/v1/me/library/playlists/([\w.]+)/tracks', path)
+        if match:
+            playlist = self.playlists.get(match.group(1))
+            if playlist is None:
+                return 'playlist tracks', 404, {'errors': []}
+            if method == 'POST':
+                playlist['tracks'].extend(item['id'] for item in body['data'])
+                return 'playlist tracks POST', 204, None
+            if method == 'DELETE':
+                library_ids = set(query.get('ids[library-songs]', '').split(','))
+                playlist['tracks'] = [song_id for song_id in playlist['tracks'] if f"i.{song_id}" not in library_ids]
+                return 'playlist tracks DELETE', 204, None
+            if not playlist['tracks']:
+                return 'playlist tracks', 404, {'errors': []}
+            return 'playlist tracks', 200, self.paginate(path, query, [
+                self.library_song(song_id) for song_id in playlist['tracks']
+            ])
+
+        match = re.fullmatch(r'/v1/me/ratings/songs/(\w+)', path)
+        if match and method == 'PUT':
+            self.ratings[match.group(1)] = body['attributes']['value']
+            return 'ratings PUT', 200, {'data': []}
+
+        if path == '/v1/me/library' and method == 'POST':
+            for item in (body or {}).get('data', []):
+                self.library.add(item['id'])
+            for song_id in query.get('ids[songs]', '').split(','):
+                if song_id:
+                    self.library.add(song_id)
+            return 'library POST', 202, None
+
+        return 'unknown', 404, {'errors': [{'title': f"No stub for {method} {path}"}]}
+
+    def paginate(self, path, query, items, max_limit=100):
+        """Library collections are paged: limit (at most 100), offset, next and meta.total"""
+        limit = min(int(query.get('limit', 25)), max_limit)
+        offset = int(query.get('offset', 0))
+        page = {'data': items[offset:offset + limit], 'meta': {'total': len(items)}}
+        if offset + limit < len(items):
+            page['next'] = f"{path}?offset={offset + limit}"
+        return page
+
+    def library_song(self, song_id):
+        """A library-songs resource for a catalog song added to a playlist"""
+        attributes = self.by_id[song_id]['attributes'] if song_id in self.by_id else {}
+        return {
+            'id': f"i.{song_id}",
+            'type': 'library-songs',
+            'attributes': {
+                'name': attributes.get('name', ''),
+                'artistName': attributes.get('artistName', ''),
+                'albumName': attributes.get('albumName', ''),
+                'playParams': {'id': f"i.{song_id}", 'kind': 'song', 'catalogId': song_id},
+            },
+        }
+
+    def matching_ids(self, term, limit, index=None):
+        """IDs of the songs (or of the albums, given the album index) containing every word of a search term"""
+        index = self.index if index is None else index
+        tokens = tokenize(term)
+        ids = set.intersection(*(index.get(token, set()) for token in tokens)) if tokens else set()
+        return sorted(ids)[:limit]
+
+    def catalog_search(self, query):
+        """amp-api catalog search: songs and albums containing every word of the term, at most 25 of each"""
+        limit = min(int(query.get('limit', 5)), 25)
+        types = query.get('types', '').split(',')
+        results = {}
+        if 'songs' in types:
+            songs = [self.by_id[song_id] for song_id in self.matching_ids(query.get('term', ''), limit)]
+            if songs:
+                results['songs'] = {'href': '/v1/catalog/search', 'data': songs}
+        if 'albums' in types:
+            albums = [
+                {key: value for key, value in self.albums[album_id].items() if key != 'tracks'}
+                for album_id in self.matching_ids(query.get('term', ''), limit, self.album_index)
+            ]
+            if albums:
+                results['albums'] = {'href': '/v1/catalog/search', 'data': albums}
+        return {'results': results, 'meta': {'results': {'order': list(results)}}}
+
+    def search(self, query):
+        """iTunes Search API: songs containing every word of the term"""
+        results = []
+        for song_id in self.matching_ids(query.get('term', ''), int(query.get('limit', 50))):
+            attributes = self.by_id[song_id]['attributes']
+            results.append({
+                'wrapperType': 'track',
+                'kind': 'song',
+                'trackId': int(song_id),
+                'trackName': attributes['name'],
+                'artistName': attributes['artistName'],
+                'collectionName': attributes['albumName'],
+                'trackTimeMillis': attributes['durationInMillis'],
+                'trackExplicitness': 'explicit' if attributes['contentRating'] == 'explicit' else 'notExplicit',
+                'trackNumber': attributes['trackNumber'],
+            })
+        return {'resultCount': len(results), 'results': results}
@@ -1,7 +1,7 @@
 from sys import argv
 import sys
 import csv
-import urllib.parse, urllib.request
+import urllib.parse
 import json
 from time import sleep
 import requests
@@ -10,10 +10,23 @@ import sys
 import time
 import platform
 from tqdm import tqdm
+from tqdm.contrib import DummyTqdmFile
 import re
 from datetime import datetime
 from difflib import SequenceMatcher
+from functools import lru_cache, wraps
 import html
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext, redirect_stdout
+import argparse
+import asyncio
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from email.utils import parsedate_to_datetime
+import sqlite3
+import threading
+import queue
 
 if platform.system() == 'Darwin':  # macOS
     try:
@@ -26,22 +39,1034 @@ if platform.system() == 'Darwin':  # macOS
 else:
     caffeine_enabled = False
 
-# Delay (in seconds) to wait between tracks
-delay = 1
+# The async engine is optional and needs httpx (and h2 for HTTP/2)
+try:
+    import httpx
+    httpx_available = True
+except ImportError:
+    httpx_available = False
+try:
+    import h2
+    http2_available = True
+except ImportError:
+    http2_available = False
 
-# Checking if the command is correct
-if len(argv) > 1 and argv[1]:
-    pass
-else:
-    print('\nCommand usage:\npython3 convert.py yourplaylist.csv\nMore info at https://github.com/delorfin/spotify-to-apple-music')
-    exit()
+# rapidfuzz is an optional, much faster backend for string similarity
+try:
+    from rapidfuzz import process as rapidfuzz_process
+    from rapidfuzz.distance import Indel
+    rapidfuzz_available = True
+except ImportError:
+    rapidfuzz_available = False
+
+# API endpoints; the benchmark stub server points these at itself
+amp_api_url = "https://amp-api.music.apple.com"
+itunes_search_url = "https://itunes.apple.com/search"
+
+# HTTP client: 'requests' (default) or 'async' (httpx on an asyncio loop)
+engine = "requests"
+
+# Text search: 'catalog' (the authenticated amp-api search, falling back to iTunes
+# when it fails) or 'itunes' (the public, much more tightly rate-limited iTunes Search API)
+search_backend = "catalog"
+
+# Number of results asked of a text search, and the song fields the catalog search returns
+search_limit = 10
+catalog_search_fields = "name,artistName,albumName,durationInMillis,contentRating,isrc,releaseDate,previews,artwork"
+
+# Maximum number of requests in flight to a single host
+host_concurrency = 16
+
+# Request rates (per second) for each API host: (initial, minimum, maximum).
+# The rate halves whenever the API throttles and creeps back up while it stays healthy.
+itunes_search_rate = (0.33, 0.05, 1.0)
+amp_api_rate = (5.0, 0.5, 20.0)
+
+# Number of tracks matched concurrently
+workers = 8
+
+# Number of CSV files of a directory processed at the same time
+parallel_playlists = 4
+
+# In sync mode, also remove playlist tracks that are no longer in the CSV
+remove_missing = False
+
+# Skip the rows an earlier, interrupted run already finished (see Journal)
+resume = False
+
+# Number of times a throttled (429) or failed (5xx) request is retried
+max_retries = 5
+
+# Number of songs added to a playlist, or to the library, per request
+playlist_chunk_size = 100
+library_chunk_size = 100
+
+# Number of tracks liked at the same time, and how often a failed like or library add is retried
+like_concurrency = 8
+write_retries = 2
+
+# Maximum number of ISRCs to resolve in a single catalog request
+isrc_batch_size = 25
+
+# Number of CSV rows read ahead so their ISRCs can be resolved in batches
+lookahead_rows = 100
+
+# Maximum number of song IDs per equivalents lookup
+equivalents_batch_size = 25
+
+# Rows of the same album in the lookahead window from which the album is resolved once and
+# its tracklist matched against, instead of searching each row (0 turns this off)
+album_min_tracks = 3
+
+# Search results whose duration differs from the CSV's by more than this many milliseconds
+# are rejected before any string is compared, e.g. live versions and edits (0 keeps them all)
+duration_tolerance_ms = 10000
+
+# Number of best-scoring search results whose catalog details are fetched
+enrich_top_k = 4
+
+# Maximum number of song IDs per catalog details request
+details_batch_size = 300
+
+# On-disk cache of catalog lookups, how long (in seconds) equivalents stay valid, and how many are kept
+cache_file = "cache.sqlite3"
+equivalents_cache_ttl = 30 * 24 * 60 * 60
+equivalents_cache_max_entries = 500000
+
+# How long (in seconds) matches and misses stay cached, and how many entries are kept
+match_cache_ttl = 90 * 24 * 60 * 60
+negative_match_cache_ttl = 7 * 24 * 60 * 60
+match_cache_max_entries = 500000
+
+# How long (in seconds) catalog songs seen in responses stay in the local catalog, and how many are kept
+local_catalog_ttl = 30 * 24 * 60 * 60
+local_catalog_max_songs = 500000
+
+# Match from the local catalog first and search only on a miss (see LocalCatalog)
+use_local_catalog = False
+
+# Maximum number of local catalog songs scored for a track
+local_search_limit = 50
+
+# Opened in __main__ unless --no-cache is given; lookups skip a cache while it is None
+equivalence_cache = None
+match_cache = None
+local_catalog = None
+
+# How often each match strategy was tried and won during this run
+strategy_stats = defaultdict(Counter)
+strategy_stats_lock = threading.Lock()
+
+# How many search results each pre-filter rule removed (or, for explicitness, demoted) during this run
+candidate_stats = Counter()
+
+# String similarity backend: 'difflib' (default), 'rapidfuzz' or 'auto' (rapidfuzz when installed).
+# rapidfuzz scores the longest common subsequence, which is never below difflib's score and
+# up to about 0.07 above it near the 0.8 match threshold, so it matches a little more loosely
+# (see bench/bench_similarity.py). It is only used when asked for.
+similarity_backend = "difflib"
+
+# Show request counts and latency next to the rate limits in the progress bar
+live_stats = False
+
+# Number of distinct strings whose normalized form is memoized
+normalize_cache_size = 65536
+
+# Number of results each lookup keeps in memory during a run (see LookupMemo)
+lookup_memo_size = 20000
+
+# Catalog details fetched during this run, None for songs not in the storefront
+track_details_cache = {}
+track_details_lock = threading.Lock()
+
+# Tracklists of the albums resolved during this run, keyed by normalized album and album
+# artist, None for albums not found in the storefront
+album_tracks_cache = {}
+album_tracks_lock = threading.Lock()
 
 class MatchResult:
-    def __init__(self, track_id=None, confidence=0, match_method=None, alternative_matches=None):
+    def __init__(self, track_id=None, confidence=0, match_method=None, alternative_matches=None, errors=0):
         self.track_id = track_id
         self.confidence = confidence
         self.match_method = match_method
         self.alternative_matches = alternative_matches or []
+        # Number of lookups that failed, so an incomplete miss is not cached
+        self.errors = errors
+
+class SQLiteCache:
+    """Base for the on-disk caches, sharing one SQLite connection per cache"""
+    schema = ""
+    
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self.lock, self.conn:
+            self.conn.executescript(self.schema)
+    
+    def select_many(self, query, params, keys):
+        """Run query with an IN list of keys, in batches below SQLite's variable limit"""
+        rows = []
+        keys = list(keys)
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows.extend(self.conn.execute(query.format(placeholders=placeholders), [*params, *batch]).fetchall())
+        return rows
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class EquivalenceCache(SQLiteCache):
+    """On-disk cache of equivalent song IDs keyed by storefront and song ID"""
+    schema = """
+        CREATE TABLE IF NOT EXISTS equivalents (
+            country_code TEXT NOT NULL,
+            song_id TEXT NOT NULL,
+            equivalent_id TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            PRIMARY KEY (country_code, song_id)
+        )
+    """
+    
+    def __init__(self, path, ttl, max_entries):
+        super().__init__(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evict()
+    
+    def get_many(self, country_code, song_ids):
+        """Return the cached, unexpired equivalents for song_ids"""
+        rows = self.select_many(
+            "SELECT song_id, equivalent_id FROM equivalents "
+            "WHERE country_code = ? AND fetched_at > ? AND song_id IN ({placeholders})",
+            [country_code, time.time() - self.ttl],
+            song_ids
+        )
+        return dict(rows)
+    
+    def set_many(self, country_code, equivalents):
+        """Store a mapping of song ID to equivalent song ID"""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO equivalents VALUES (?, ?, ?, ?)",
+                [(country_code, song_id, equivalent_id, now) for song_id, equivalent_id in equivalents.items()]
+            )
+    
+    def evict(self):
+        """Drop expired entries, then the oldest ones above max_entries"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM equivalents WHERE fetched_at <= ?", (time.time() - self.ttl,))
+            self.conn.execute(
+                "DELETE FROM equivalents WHERE rowid IN (SELECT rowid FROM equivalents ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+class MatchCache(SQLiteCache):
+    """On-disk cache of ISRC and text search matches, including misses"""
+    schema = """
+        CREATE TABLE IF NOT EXISTS matches (
+            country_code TEXT NOT NULL,
+            key TEXT NOT NULL,
+            track_id TEXT,
+            confidence REAL NOT NULL,
+            match_method TEXT,
+            alternatives TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            PRIMARY KEY (country_code, key)
+        )
+    """
+    
+    def __init__(self, path, ttl, negative_ttl, max_entries):
+        super().__init__(path)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evict()
+    
+    def get_many(self, country_code, keys):
+        """Return unexpired cached MatchResults for keys"""
+        now = time.time()
+        rows = self.select_many(
+            "SELECT key, track_id, confidence, match_method, alternatives, created_at FROM matches "
+            "WHERE country_code = ? AND key IN ({placeholders})",
+            [country_code],
+            keys
+        )
+        results = {}
+        for key, track_id, confidence, match_method, alternatives, created_at in rows:
+            ttl = self.ttl if track_id else self.negative_ttl
+            if created_at > now - ttl:
+                results[key] = MatchResult(track_id, confidence, match_method, json.loads(alternatives))
+        
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE matches SET accessed_at = ? WHERE country_code = ? AND key = ?",
+                [(now, country_code, key) for key in results]
+            )
+        return results
+    
+    def count(self, hit):
+        """Count a lookup answered from the cache (hit) or sent to the API (miss)"""
+        run_metrics.record_cache('match', hit)
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+    
+    def set_many(self, country_code, matches):
+        """Store MatchResults keyed by their lookup key"""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(country_code, key, str(result.track_id) if result.track_id else None, result.confidence,
+                  result.match_method, json.dumps(result.alternative_matches), now, now)
+                 for key, result in matches.items()]
+            )
+    
+    def evict(self):
+        """Drop expired entries, then the least recently used ones above max_entries"""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM matches WHERE (track_id IS NOT NULL AND created_at <= ?) OR (track_id IS NULL AND created_at <= ?)",
+                (now - self.ttl, now - self.negative_ttl)
+            )
+            self.conn.execute(
+                "DELETE FROM matches WHERE rowid IN (SELECT rowid FROM matches ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+class LocalCatalog(SQLiteCache):
+    """Catalog songs seen in API responses or imported from a dump, indexed in memory
+    by title/artist/album word and by ISRC so tracks can be matched without the network"""
+    schema = """
+        CREATE TABLE IF NOT EXISTS catalog_songs (
+            country_code TEXT NOT NULL,
+            song_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            artist_name TEXT NOT NULL,
+            album_name TEXT NOT NULL,
+            isrc TEXT,
+            fetched_at REAL NOT NULL,
+            PRIMARY KEY (country_code, song_id)
+        );
+        CREATE TABLE IF NOT EXISTS catalog_isrcs (
+            country_code TEXT NOT NULL,
+            isrc TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            PRIMARY KEY (country_code, isrc)
+        );
+    """
+    
+    def __init__(self, path, ttl, max_songs):
+        super().__init__(path)
+        self.ttl = ttl
+        self.max_songs = max_songs
+        self.hits = 0
+        self.misses = 0
+        self.evict()
+        # The in-memory index holds one storefront, loaded on first use
+        self.country_code = None
+        self.songs = {}
+        self.tokens = defaultdict(set)
+        self.by_isrc = defaultdict(set)
+        # ISRCs whose catalog songs are all known, so the index can answer for them
+        self.complete_isrcs = set()
+    
+    def evict(self):
+        """Drop expired songs, then the oldest ones above max_songs
+        
+        An ISRC stays complete only while all of its songs are kept: they were stored with it,
+        so no later than it, and songs are dropped oldest first along with ISRCs as old as they are.
+        """
+        since = time.time() - self.ttl
+        with self.lock, self.conn:
+            cutoff = self.conn.execute(
+                "SELECT fetched_at FROM catalog_songs ORDER BY fetched_at DESC LIMIT 1 OFFSET ?", (self.max_songs,)
+            ).fetchone()
+            if cutoff:
+                since = max(since, cutoff[0])
+            self.conn.execute("DELETE FROM catalog_songs WHERE fetched_at <= ?", (since,))
+            self.conn.execute("DELETE FROM catalog_isrcs WHERE fetched_at <= ?", (since,))
+    
+    def load(self, country_code):
+        """Index the unexpired songs of a storefront; call with the lock held"""
+        self.country_code = country_code
+        self.songs.clear()
+        self.tokens.clear()
+        self.by_isrc.clear()
+        self.complete_isrcs.clear()
+        since = time.time() - self.ttl
+        rows = self.conn.execute(
+            "SELECT song_id, name, artist_name, album_name, isrc FROM catalog_songs "
+            "WHERE country_code = ? AND fetched_at > ?",
+            (country_code, since)
+        )
+        for row in rows:
+            self.index(*row)
+        self.complete_isrcs.update(isrc for (isrc,) in self.conn.execute(
+            "SELECT isrc FROM catalog_isrcs WHERE country_code = ? AND fetched_at > ?",
+            (country_code, since)
+        ))
+    
+    def index(self, song_id, name, artist_name, album_name, isrc):
+        if not isrc and song_id in self.songs:
+            isrc = self.songs[song_id][3]
+        self.songs[song_id] = (name, artist_name, album_name, isrc)
+        for token in set(f"{clean_string(name)} {clean_string(artist_name)} {clean_string(album_name)}".split()):
+            self.tokens[token].add(song_id)
+        if isrc:
+            self.by_isrc[isrc].add(song_id)
+    
+    def add_songs(self, country_code, songs, complete_isrcs=()):
+        """Store (song ID, name, artist, album, ISRC) tuples; complete_isrcs are the ISRCs
+        whose catalog songs are all among them"""
+        now = time.time()
+        songs = [
+            (str(song_id), name or '', artist_name or '', album_name or '', isrc.upper() if isrc else None)
+            for song_id, name, artist_name, album_name, isrc in songs
+        ]
+        complete_isrcs = {isrc.upper() for isrc in complete_isrcs}
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO catalog_songs VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (country_code, song_id) DO UPDATE SET name = excluded.name, "
+                "artist_name = excluded.artist_name, album_name = excluded.album_name, "
+                "isrc = COALESCE(excluded.isrc, catalog_songs.isrc), fetched_at = excluded.fetched_at",
+                [(country_code, *song, now) for song in songs]
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO catalog_isrcs VALUES (?, ?, ?)",
+                [(country_code, isrc, now) for isrc in complete_isrcs]
+            )
+            if self.country_code == country_code:
+                for song in songs:
+                    self.index(*song)
+                self.complete_isrcs.update(complete_isrcs)
+    
+    def isrc_candidates(self, country_code, isrc):
+        """Catalog song resources with an ISRC, or None if the index may not know all of them"""
+        isrc = isrc.upper()
+        with self.lock:
+            if self.country_code != country_code:
+                self.load(country_code)
+            if isrc not in self.complete_isrcs:
+                return None
+            return [self.resource(song_id) for song_id in sorted(self.by_isrc.get(isrc, ()))]
+    
+    def search(self, country_code, title, artist, limit):
+        """Songs containing every word of the title and artist, shaped like iTunes search results"""
+        terms = set(f"{clean_string(remove_features(title))} {clean_string(artist)}".split())
+        if not terms:
+            return []
+        with self.lock:
+            if self.country_code != country_code:
+                self.load(country_code)
+            postings = sorted((self.tokens.get(term, set()) for term in terms), key=len)
+            song_ids = postings[0].intersection(*postings[1:])
+            return [self.search_result(song_id) for song_id in sorted(song_ids)[:limit]]
+    
+    def resource(self, song_id):
+        name, artist_name, album_name, isrc = self.songs[song_id]
+        return {
+            'id': song_id,
+            'type': 'songs',
+            'attributes': {'name': name, 'artistName': artist_name, 'albumName': album_name, 'isrc': isrc}
+        }
+    
+    def search_result(self, song_id):
+        name, artist_name, album_name, isrc = self.songs[song_id]
+        return {'trackId': song_id, 'trackName': name, 'artistName': artist_name, 'collectionName': album_name, 'isrc': isrc}
+    
+    def count(self, hit):
+        """Count a lookup answered from the index (hit) or sent to the API (miss)"""
+        run_metrics.record_cache('local_catalog', hit)
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+def remember_catalog_songs(songs, complete_isrcs=()):
+    """Add the catalog song resources of an API response to the local catalog"""
+    if local_catalog:
+        local_catalog.add_songs(country_code, [
+            (song['id'], song['attributes'].get('name'), song['attributes'].get('artistName'),
+             song['attributes'].get('albumName'), song['attributes'].get('isrc'))
+            for song in songs if song.get('attributes')
+        ], complete_isrcs)
+
+def remember_search_results(results):
+    """Add the songs of an iTunes search response to the local catalog"""
+    if local_catalog:
+        local_catalog.add_songs(country_code, [
+            (result['trackId'], result.get('trackName'), result.get('artistName'), result.get('collectionName'), None)
+            for result in results if result.get('trackId')
+        ])
+
+def import_catalog(path, complete=False):
+    """Load a dump of catalog songs into the local catalog, returning how many were read
+    
+    The dump is JSON (a list, or a response with 'data') or JSON lines, holding amp-api
+    song resources or iTunes search results. Only if complete is set is it taken to hold
+    every song of its ISRCs in the current storefront, so their lookups are answered locally.
+    """
+    with open(path, encoding='utf-8') as dump:
+        text = dump.read()
+    try:
+        items = json.loads(text)
+    except ValueError:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(items, dict):
+        items = items.get('data') or items.get('results') or []
+    
+    songs = [item for item in items if item.get('attributes')]
+    results = [item for item in items if item.get('trackId')]
+    complete_isrcs = {song['attributes']['isrc'] for song in songs if song['attributes'].get('isrc')} if complete else ()
+    remember_catalog_songs(songs, complete_isrcs)
+    remember_search_results(results)
+    return len(songs) + len(results)
+
+class RateLimiter:
+    """Token bucket whose rate adapts to how the API responds"""
+    def __init__(self, name, rate, min_rate, max_rate, increase_after=20):
+        self.name = name
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_after = increase_after
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.successes = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            sleep(wait)
+    
+    def on_success(self):
+        """Speed up a little after a run of healthy responses"""
+        with self.lock:
+            self.successes += 1
+            if self.successes >= self.increase_after:
+                self.successes = 0
+                self.rate = min(self.max_rate, self.rate * 1.1)
+    
+    def on_throttle(self, retry_after=None):
+        """Halve the rate and pause for Retry-After (or one request interval)"""
+        with self.lock:
+            self.throttled += 1
+            self.successes = 0
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+    
+    def status(self):
+        return f"{self.name} {self.rate:.2f}/s"
+
+rate_limiters = {
+    "search": RateLimiter("search", *itunes_search_rate),
+    "api": RateLimiter("api", *amp_api_rate),
+}
+
+def limiter_for(url):
+    """Rate limiter of the API that url belongs to, if any"""
+    if url.startswith(itunes_search_url):
+        return rate_limiters["search"]
+    if url.startswith(amp_api_url):
+        return rate_limiters["api"]
+    return None
+
+def rate_limit_status():
+    """Current rates and throttle count, for the progress bar"""
+    throttled = sum(limiter.throttled for limiter in rate_limiters.values())
+    return ", ".join(limiter.status() for limiter in rate_limiters.values()) + f", throttled {throttled}x"
+
+def parse_retry_after(value):
+    """Convert a Retry-After header (seconds or HTTP date) into seconds"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(method, status_code):
+    """429s are always safe to retry; server errors only for idempotent methods"""
+    if status_code == 429:
+        return True
+    return status_code >= 500 and method.upper() in ('GET', 'HEAD', 'PUT', 'DELETE')
+
+class RunMetrics:
+    """Counts and timings of a run: requests per endpoint, operations, caches and matching"""
+    # Upper bounds (in seconds) of the latency histogram buckets
+    latency_buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Seconds the current thread spent sending requests, for the CPU/network split
+        self.thread_timing = threading.local()
+        self.reset()
+    
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.endpoints = defaultdict(lambda: {
+                'requests': 0, 'retries': 0, 'errors': 0, 'bytes': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                'rate_limit_wait': 0.0, 'statuses': Counter(), 'histogram': [0] * len(self.latency_buckets)
+            })
+            self.operations = defaultdict(lambda: {'calls': 0, 'seconds': 0.0})
+            self.caches = defaultdict(Counter)
+            self.matching = {'rows': 0, 'seconds': 0.0, 'cpu': 0.0, 'network': 0.0}
+    
+    def record_request(self, endpoint, response, seconds, waited, retries):
+        """Count a request (with its retries); response is None if it raised"""
+        self.thread_timing.network = self.network_time() + seconds + waited
+        status = response.status_code if response is not None else 'error'
+        size = len(response.content or b'') if response is not None else 0
+        bucket = next(index for index, bound in enumerate(self.latency_buckets) if seconds <= bound)
+        with self.lock:
+            stats = self.endpoints[endpoint]
+            stats['requests'] += 1
+            stats['retries'] += retries
+            stats['errors'] += status == 'error' or status >= 400
+            stats['bytes'] += size
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['rate_limit_wait'] += waited
+            stats['statuses'][str(status)] += 1
+            stats['histogram'][bucket] += 1
+    
+    def record_operation(self, name, seconds):
+        with self.lock:
+            self.operations[name]['calls'] += 1
+            self.operations[name]['seconds'] += seconds
+    
+    def record_cache(self, cache, hit=None, hits=0, misses=0):
+        """Count one lookup (hit=True/False) or many (hits, misses) of a cache"""
+        if hit is not None:
+            hits, misses = (1, 0) if hit else (0, 1)
+        with self.lock:
+            self.caches[cache]['hits'] += hits
+            self.caches[cache]['misses'] += misses
+    
+    def network_time(self):
+        return getattr(self.thread_timing, 'network', 0.0)
+    
+    def record_match(self, seconds, cpu, network):
+        with self.lock:
+            self.matching['rows'] += 1
+            self.matching['seconds'] += seconds
+            self.matching['cpu'] += cpu
+            self.matching['network'] += network
+    
+    def status(self):
+        """Request count, mean latency and retries so far, for the progress bar"""
+        with self.lock:
+            requests_sent = sum(stats['requests'] for stats in self.endpoints.values())
+            seconds = sum(stats['seconds'] for stats in self.endpoints.values())
+            retries = sum(stats['retries'] for stats in self.endpoints.values())
+        mean = seconds / requests_sent * 1000 if requests_sent else 0
+        return f"{requests_sent} requests, {mean:.0f} ms avg, {retries} retries"
+    
+    def report(self):
+        """The run's metrics as a JSON-serializable dict"""
+        bucket_names = [f"<={bound:g}s" if bound != float('inf') else "slower" for bound in self.latency_buckets]
+        with self.lock:
+            return {
+                'started': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+                'duration': time.time() - self.started,
+                'endpoints': {
+                    endpoint: {
+                        **{key: stats[key] for key in ('requests', 'retries', 'errors', 'bytes', 'seconds', 'max_seconds', 'rate_limit_wait')},
+                        'mean_seconds': stats['seconds'] / stats['requests'] if stats['requests'] else 0,
+                        'statuses': dict(stats['statuses']),
+                        'latency_histogram': dict(zip(bucket_names, stats['histogram'])),
+                    }
+                    for endpoint, stats in sorted(self.endpoints.items())
+                },
+                'operations': {name: dict(stats) for name, stats in sorted(self.operations.items())},
+                'caches': {name: dict(counts) for name, counts in sorted(self.caches.items())},
+                # Matching time not spent sending requests (or waiting for the rate limit) is CPU or locks
+                'matching': dict(self.matching),
+                'rate_limits': {
+                    name: {'rate': limiter.rate, 'throttled': limiter.throttled}
+                    for name, limiter in rate_limiters.items()
+                },
+            }
+    
+    def write_report(self, path):
+        """Write the report as JSON, or as section,name,metric,value rows if path ends in .csv"""
+        report = self.report()
+        with open(path, 'w', encoding='utf-8', newline='') as output:
+            if not path.lower().endswith('.csv'):
+                json.dump(report, output, indent=2)
+                return
+            writer = csv.writer(output)
+            writer.writerow(['section', 'name', 'metric', 'value'])
+            writer.writerow(['run', '', 'started', report['started']])
+            writer.writerow(['run', '', 'duration', report['duration']])
+            for section in ('endpoints', 'operations', 'caches', 'rate_limits'):
+                for name, metrics in report[section].items():
+                    for metric, value in metrics.items():
+                        if isinstance(value, dict):
+                            for key, count in value.items():
+                                writer.writerow([section, name, f"{metric}[{key}]", count])
+                        else:
+                            writer.writerow([section, name, metric, value])
+            for metric, value in report['matching'].items():
+                writer.writerow(['matching', '', metric, value])
+
+run_metrics = RunMetrics()
+
+def instrumented(function):
+    """Record the calls and wall time of an operation that talks to the APIs"""
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            run_metrics.record_operation(function.__name__, time.perf_counter() - started)
+    return wrapper
+
+class LookupMemo:
+    """Size-bounded in-memory memo of a lookup for the run, keyed by its normalized parameters
+    
+    Concurrent callers asking for the same key wait for the one request in flight instead of
+    sending their own. The least recently used results are dropped beyond lookup_memo_size.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.results = OrderedDict()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.joined = 0
+        self.misses = 0
+        lookup_memos.append(self)
+    
+    def call(self, key, compute, keep):
+        """Return the result for key, calling compute only if it is neither memoized nor in flight"""
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                self.hits += 1
+                result = self.results[key]
+                future = None
+            else:
+                future = self.in_flight.get(key)
+                owner = future is None
+                if owner:
+                    future = self.in_flight[key] = Future()
+                    self.misses += 1
+                else:
+                    self.joined += 1
+        if future is None:
+            run_metrics.record_cache(self.name, hit=True)
+            return result
+        run_metrics.record_cache(self.name, hit=not owner)
+        if not owner:
+            return future.result()
+        
+        try:
+            result = compute()
+        except BaseException as e:
+            with self.lock:
+                del self.in_flight[key]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            del self.in_flight[key]
+            # Results that may come from a failed request are not kept, so a later call retries
+            if keep(result):
+                self.store(key, result)
+        future.set_result(result)
+        return result
+    
+    def get_many(self, keys):
+        """Return the memoized results of keys, for lookups made in batches"""
+        with self.lock:
+            found = {key: self.results[key] for key in keys if key in self.results}
+            for key in found:
+                self.results.move_to_end(key)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        run_metrics.record_cache(self.name, hits=len(found), misses=len(keys) - len(found))
+        return found
+    
+    def set_many(self, results):
+        with self.lock:
+            for key, result in results.items():
+                self.store(key, result)
+    
+    def store(self, key, result):
+        self.results[key] = result
+        self.results.move_to_end(key)
+        while len(self.results) > lookup_memo_size:
+            self.results.popitem(last=False)
+    
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+            self.reset_stats()
+    
+    def reset_stats(self):
+        self.hits = self.joined = self.misses = 0
+
+# Every LookupMemo, for the end of run statistics
+lookup_memos = []
+
+def memoized(key, keep=lambda result: result is not None):
+    """Memoize a lookup for the run under key(*args) and the storefront (see LookupMemo)"""
+    def decorate(function):
+        memo = LookupMemo(function.__name__)
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            return memo.call((country_code, key(*args, **kwargs)), lambda: function(*args, **kwargs), keep)
+        wrapper.memo = memo
+        return wrapper
+    return decorate
+
+def print_memo_stats():
+    """Print how many calls of each memoized lookup were answered without a request of their own"""
+    memos = [memo for memo in lookup_memos if memo.hits + memo.joined + memo.misses]
+    if not memos:
+        return
+    print("\n=== Lookups Answered In Memory ===")
+    for memo in memos:
+        calls = memo.hits + memo.joined + memo.misses
+        saved = memo.hits + memo.joined
+        joined = f", {memo.joined} waited for the same request in flight" if memo.joined else ""
+        print(f"{memo.name}: {saved}/{calls} ({saved / calls * 100:.1f}%){joined}")
+
+def endpoint_name(method, url):
+    """Group a request URL by endpoint, e.g. 'GET /v1/catalog/{storefront}/songs?filter[isrc]'"""
+    if url.startswith(itunes_search_url):
+        return f"{method} search"
+    parsed = urllib.parse.urlparse(url)
+    path = re.sub(r'^/v1/catalog/[^/]+', '/v1/catalog/{storefront}', parsed.path)
+    path = re.sub(r'/(songs|playlists)/[^/]+', r'/\1/{id}', path)
+    query = [key for key in urllib.parse.parse_qs(parsed.query) if key.startswith('filter[') or key == 'ids']
+    return f"{method} {path}" + (f"?{query[0]}" if query else "")
+
+def send_limited(method, url, send):
+    """Send a request through its API's rate limiter, retrying throttled responses"""
+    limiter = limiter_for(url)
+    started = time.perf_counter()
+    waited = 0.0
+    attempts = 0
+    response = None
+    try:
+        for attempt in range(max_retries + 1 if limiter else 1):
+            if limiter:
+                acquired = time.perf_counter()
+                limiter.acquire()
+                waited += time.perf_counter() - acquired
+            attempts += 1
+            response = None
+            response = send()
+            if not limiter:
+                break
+            if response.status_code == 429 or response.status_code >= 500:
+                # A struggling server slows the pace down even when the request can't be retried
+                limiter.on_throttle(parse_retry_after(response.headers.get('Retry-After')))
+            else:
+                limiter.on_success()
+            if not is_retryable(method, response.status_code):
+                break
+        return response
+    finally:
+        run_metrics.record_request(endpoint_name(method, url), response, time.perf_counter() - started - waited,
+                                   waited, max(0, attempts - 1))
+
+class LimitedSession(requests.Session):
+    """Session that paces requests per host and retries throttled ones"""
+    def __init__(self):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=host_concurrency)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+    
+    def request(self, method, url, *args, **kwargs):
+        send = super().request
+        return send_limited(method, url, lambda: send(method, url, *args, **kwargs))
+
+class EngineResponse:
+    """The parts of a requests.Response that the call sites use"""
+    def __init__(self, status_code, content, headers, reason):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.reason = reason
+    
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+class AsyncEngine:
+    """Session-like client that sends every request through one asyncio loop.
+    
+    Connections are pooled and multiplexed over HTTP/2 when h2 is installed, and
+    each host is capped at host_concurrency requests in flight. Worker threads
+    call it like a requests.Session and block until their response arrives.
+    """
+    def __init__(self):
+        self.headers = CaseInsensitiveDict()
+        self.semaphores = {}
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.client = self.run(self.open_client())
+    
+    async def open_client(self):
+        return httpx.AsyncClient(
+            http2=http2_available,
+            limits=httpx.Limits(max_connections=host_concurrency * 2, max_keepalive_connections=host_concurrency * 2),
+            timeout=30,
+        )
+    
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+    
+    async def send(self, method, url, headers, kwargs):
+        host = urllib.parse.urlparse(url).netloc
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(host_concurrency)
+        async with self.semaphores[host]:
+            response = await self.client.request(method, url, headers=headers, **kwargs)
+        return EngineResponse(response.status_code, response.content, response.headers, response.reason_phrase)
+    
+    def request(self, method, url, headers=None, **kwargs):
+        # Merge like requests does: a None value removes a session header
+        merged = CaseInsensitiveDict(self.headers)
+        for key, value in (headers or {}).items():
+            if value is None:
+                merged.pop(key, None)
+            else:
+                merged[key] = value
+        # httpx derives Host (or :authority on HTTP/2) from the URL, and only
+        # advertises the encodings it can actually decode
+        merged.pop("Host", None)
+        merged.pop("Accept-Encoding", None)
+        return send_limited(method, url, lambda: self.run(self.send(method, url, dict(merged), kwargs)))
+    
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+    
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+    
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+    
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+    
+    def close(self):
+        self.run(self.client.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+def make_session():
+    """Open the HTTP client selected with --engine"""
+    if engine == "async":
+        if httpx_available:
+            return AsyncEngine()
+        print("Note: Install 'httpx' to use the async engine, falling back to requests:")
+        print("pip install 'httpx[http2]'")
+    return LimitedSession()
+
+# Session headers that must not be sent to the public iTunes Search API
+anonymous_headers = {
+    "Authorization": None,
+    "media-user-token": None,
+    "Cookie": None,
+    "Host": None,
+    "Origin": None,
+    "Referer": None,
+}
+
+def itunes_search(session, url):
+    """Query the iTunes Search API over the shared, pooled session"""
+    response = session.get(url, headers=anonymous_headers)
+    if response.status_code != 200:
+        raise Exception(f"Error {response.status_code}: {response.reason}")
+    return json.loads(response.content.decode('utf-8'))
+
+def catalog_search(session, term):
+    """Search songs with the authenticated catalog search, in the iTunes Search API's result shape"""
+    response = session.get(
+        f"{amp_api_url}/v1/catalog/{country_code}/search",
+        params={"types": "songs", "term": term, "limit": search_limit, "fields[songs]": catalog_search_fields}
+    )
+    if response.status_code != 200:
+        raise Exception(f"Error {response.status_code}: {response.reason}")
+    songs = json.loads(response.content.decode('utf-8')).get('results', {}).get('songs', {}).get('data', [])
+    remember_catalog_songs(songs)
+    # The results already hold the details enhance_itunes_match would fetch
+    remember_track_details(songs)
+    return [catalog_search_result(song) for song in songs]
+
+def catalog_search_result(song):
+    """A catalog song resource in the iTunes Search API's result shape"""
+    attributes = song.get('attributes', {})
+    return {
+        'trackId': song['id'],
+        'trackName': attributes.get('name', ''),
+        'artistName': attributes.get('artistName', ''),
+        'collectionName': attributes.get('albumName', ''),
+        'trackTimeMillis': attributes.get('durationInMillis'),
+        'trackExplicitness': {'explicit': 'explicit', 'clean': 'cleaned'}.get(attributes.get('contentRating'), 'notExplicit'),
+        'isrc': attributes.get('isrc'),
+    }
+
+def search_songs(session, term):
+    """Search songs with the selected backend, returning iTunes-shaped results"""
+    if search_backend == 'catalog':
+        try:
+            return catalog_search(session, term)
+        except Exception:
+            pass  # Fall back to the public search below
+    data = itunes_search(
+        session,
+        f"{itunes_search_url}?country={country_code}&media=music&entity=song&limit={search_limit}&term={urllib.parse.quote(term)}"
+    )
+    results = data.get('results', [])
+    remember_search_results(results)
+    return results
 
 def get_connection_data(f, prompt):
     """Get connection data from file or user input"""
@@ -51,58 +1076,148 @@ def get_connection_data(f, prompt):
     else:
         return input(prompt)
 
+# Applied in one pass each; the alternatives are whole words, so the result
+# matches applying them one by one
+punctuation_pattern = re.compile(r'[^\w\s]')
+removals_pattern = re.compile(
+    r'\b(?:'
+    r'(?:official\s+)?(?:music\s+)?video'
+    r'|(?:official\s+)?audio'
+    r'|official'
+    r'|lyrics'
+    r'|remix'
+    r'|ver(?:\.|sion)?'
+    r'|remaster(?:ed)?'
+    r')\b',
+    re.IGNORECASE
+)
+features_pattern = re.compile(
+    r'\(feat\..*?\)'
+    r'|\(ft\..*?\)'
+    r'|\(featuring.*?\)'
+    r'|\(with.*?\)'
+    r'|\bfeat\..*?(?=\s|$|\()'
+    r'|\bft\..*?(?=\s|$|\()'
+    r'|\bfeaturing.*?(?=\s|$|\()'
+    r'|\bwith\s+(?:[^()]+)(?=\s|$|\()',
+    re.IGNORECASE
+)
+
+@lru_cache(maxsize=normalize_cache_size)
 def clean_string(s):
     """Enhanced string cleaning with additional music-specific normalizations"""
     if not s:
         return ""
-    # Convert to lowercase and remove special characters
-    s = re.sub(r'[^\w\s]', ' ', s.lower())
-    
-    # Remove common additions
-    removals = [
-        r'\b(official\s+)?(music\s+)?video\b',
-        r'\b(official\s+)?(audio)\b',
-        r'\b(official\s+)?(lyric\s+video)\b',
-        r'\bofficial\b',
-        r'\blyrics\b',
-        r'\bremix\b',
-        r'\bver(\.|sion)?\b',
-        r'\bremaster(ed)?\b'
-    ]
-    for pattern in removals:
-        s = re.sub(pattern, '', s, flags=re.IGNORECASE)
+    # Convert to lowercase, remove special characters and common additions
+    s = removals_pattern.sub('', punctuation_pattern.sub(' ', s.lower()))
     
     # Normalize whitespace
     return ' '.join(s.split())
 
+@lru_cache(maxsize=normalize_cache_size)
 def remove_features(title):
     """Remove featuring artists with enhanced pattern matching"""
     if not title:
         return ""
-    patterns = [
-        r'\(feat\..*?\)',
-        r'\(ft\..*?\)',
-        r'\(featuring.*?\)',
-        r'\(with.*?\)',
-        r'\bfeat\..*?(?=\s|$|\()',
-        r'\bft\..*?(?=\s|$|\()',
-        r'\bfeaturing.*?(?=\s|$|\()',
-        r'\bwith\s+(?:[^()]+)(?=\s|$|\()'
-    ]
-    for pattern in patterns:
-        title = re.sub(pattern, '', title, flags=re.IGNORECASE)
-    return title.strip()
+    return features_pattern.sub('', title).strip()
 
 def get_string_similarity(str1, str2):
     """Calculate similarity between two strings"""
     # Handle None values
     if not str1 or not str2:
         return 0
-    return SequenceMatcher(None, clean_string(str1), clean_string(str2)).ratio()
+    return get_normalized_similarity(clean_string(str1), clean_string(str2))
+
+def get_normalized_similarity(str1, str2):
+    """Similarity of two strings that already went through clean_string"""
+    return score_similarities(str1, [str2])[0]
+
+def difflib_similarities(query, candidates):
+    """SequenceMatcher ratios of a query against each candidate"""
+    matcher = SequenceMatcher(None)
+    # The ratio is not symmetric, so the query stays the first sequence as it always was.
+    # SequenceMatcher only indexes the second one, so each candidate is indexed anew.
+    matcher.set_seq1(query)
+    scores = []
+    for candidate in candidates:
+        if not candidate:
+            scores.append(0)
+            continue
+        matcher.set_seq2(candidate)
+        scores.append(matcher.ratio())
+    return scores
+
+def rapidfuzz_similarities(query, candidates):
+    """Normalized longest-common-subsequence similarity of a query to each candidate, in one call into C"""
+    scores = [0] * len(candidates)
+    for _, score, index in rapidfuzz_process.extract(query, candidates, scorer=Indel.normalized_similarity,
+                                                     limit=None):
+        scores[index] = score if candidates[index] else 0
+    return scores
+
+similarity_scorers = {
+    'difflib': difflib_similarities,
+    'rapidfuzz': rapidfuzz_similarities,
+}
+
+def get_similarity_scorer():
+    """The similarity function selected with --similarity"""
+    if similarity_backend == 'auto':
+        return rapidfuzz_similarities if rapidfuzz_available else difflib_similarities
+    if similarity_backend == 'rapidfuzz' and not rapidfuzz_available:
+        return difflib_similarities
+    return similarity_scorers[similarity_backend]
+
+def score_similarities(query, candidates):
+    """Similarity of a normalized query to each normalized candidate, in one call"""
+    if not query:
+        return [0] * len(candidates)
+    return get_similarity_scorer()(query, candidates)
+
+def fetch_all_pages(session, path, page_size=100):
+    """Fetch every item of a paginated amp-api collection, returning (status code, items)"""
+    def page_url(page_path, offset=None):
+        url = f"{amp_api_url}{page_path}"
+        if 'limit=' not in url:
+            url += f"{'&' if '?' in url else '?'}limit={page_size}"
+        if offset is not None:
+            url += f"&offset={offset}"
+        return url
+    
+    response = session.get(page_url(path))
+    if response.status_code != 200:
+        return response.status_code, []
+    page = response.json()
+    items = list(page.get('data', []))
+    total = page.get('meta', {}).get('total')
+    
+    if page.get('next') and total and items:
+        # The size is known up front, so fetch the remaining pages concurrently
+        def fetch_page(offset):
+            response = session.get(page_url(path, offset))
+            if response.status_code != 200:
+                raise Exception(f"Error {response.status_code} while fetching {path} at offset {offset}!")
+            return response.json().get('data', [])
+        
+        offsets = range(len(items), total, len(items))
+        with ThreadPoolExecutor(max_workers=min(workers, len(offsets))) as executor:
+            for data in executor.map(fetch_page, offsets):
+                items.extend(data)
+    else:
+        next_path = page.get('next')
+        while next_path:
+            response = session.get(page_url(next_path))
+            if response.status_code != 200:
+                raise Exception(f"Error {response.status_code} while fetching {next_path}!")
+            page = response.json()
+            items.extend(page.get('data', []))
+            next_path = page.get('next')
+    
+    return 200, items
 
 def create_apple_music_playlist(session, playlist_name):
     """Create a new playlist in Apple Music"""
-    url = "https://amp-api.music.apple.com/v1/me/library/playlists"
+    url = f"{amp_api_url}/v1/me/library/playlists"
     data = {
         'attributes': {
             'name': playlist_name,
@@ -111,10 +1226,16 @@ def create_apple_music_playlist(session, playlist_name):
     }
     
     # Test if playlist exists and create it if not
-    response = session.get(url)
-    if response.status_code == 200:
-        for playlist in response.json()['data']:
-            if playlist['attributes']['name'] == playlist_name:
+    try:
+        status_code, playlists = fetch_all_pages(session, "/v1/me/library/playlists")
+    except Exception as e:
+        # As when the first page fails, the playlist is created without checking
+        print(f"Error listing your playlists: {e}")
+        status_code, playlists = None, []
+    if status_code == 200:
+        # The first of several playlists with the name is used, as it always was
+        for playlist in playlists:
+            if playlist['attributes'].get('name') == playlist_name:
                 print(f"Playlist {playlist_name} already exists!")
                 return playlist['id']
     
@@ -132,9 +1253,10 @@ def create_apple_music_playlist(session, playlist_name):
         raise Exception(f"Error {response.status_code} while creating playlist {playlist_name}!")
         sys.exit(1)
 
+@instrumented
 def like_track(session, song_id):
     """Function to like/rate a track in Apple Music"""
-    url = f"https://amp-api.music.apple.com/v1/me/ratings/songs/{song_id}"
+    url = f"{amp_api_url}/v1/me/ratings/songs/{song_id}"
     data = {
         "type": "rating",
         "attributes": {
@@ -143,31 +1265,64 @@ def like_track(session, song_id):
     }
     try:
         response = session.put(url, json=data)
-        return "OK" if response.status_code in [200, 201, 204] else "ERROR"
+        if response.status_code in [200, 201, 204]:
+            return "OK"
+        elif response.status_code in [401, 403]:
+            return "UNAUTHORIZED"
+        else:
+            return "ERROR"
     except Exception:
         return "ERROR"
 
-def get_track_details(track_id, session):
-    """Get detailed track information from Apple Music"""
-    try:
-        url = f"https://amp-api.music.apple.com/v1/catalog/{country_code}/songs/{track_id}"
-        response = session.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            if 'data' in data and data['data']:
-                track = data['data'][0]['attributes']
-                return {
-                    'id': track_id,
-                    'name': track['name'],
-                    'artist': track['artistName'],
-                    'album': track['albumName'],
-                    'preview_url': track.get('previews', [{}])[0].get('url'),
-                    'artwork_url': track.get('artwork', {}).get('url'),
-                    'release_date': track.get('releaseDate')
-                }
-    except Exception as e:
-        print(f"Error getting track details: {e}")
-    return None
+def parse_track_details(song):
+    """Pick the fields we use out of a catalog song resource"""
+    track = song['attributes']
+    return {
+        'id': song['id'],
+        'name': track['name'],
+        'artist': track['artistName'],
+        'album': track['albumName'],
+        'preview_url': track.get('previews', [{}])[0].get('url'),
+        'artwork_url': track.get('artwork', {}).get('url'),
+        'release_date': track.get('releaseDate'),
+        'isrc': track.get('isrc')
+    }
+
+@instrumented
+def get_tracks_details(track_ids, session):
+    """Get track information for many songs with one request per batch, caching it for the run"""
+    track_ids = list(dict.fromkeys(str(track_id) for track_id in track_ids))
+    with track_details_lock:
+        missing = [track_id for track_id in track_ids if track_id not in track_details_cache]
+    run_metrics.record_cache('track_details', hits=len(track_ids) - len(missing), misses=len(missing))
+    
+    for start in range(0, len(missing), details_batch_size):
+        batch = missing[start:start + details_batch_size]
+        try:
+            response = session.get(f"{amp_api_url}/v1/catalog/{country_code}/songs?ids={','.join(batch)}")
+            if response.status_code != 200:
+                raise Exception(f"Error {response.status_code}: {response.reason}")
+            songs = response.json().get('data', [])
+            found = {song['id']: parse_track_details(song) for song in songs}
+        except Exception as e:
+            print(f"Error getting track details: {e}")
+            continue
+        remember_catalog_songs(songs)
+        # Songs missing from the response are not available in this storefront
+        with track_details_lock:
+            for track_id in batch:
+                track_details_cache[track_id] = found.get(track_id)
+    
+    # Songs whose lookup failed are left out, unlike songs known to be missing
+    with track_details_lock:
+        return {track_id: track_details_cache[track_id] for track_id in track_ids if track_id in track_details_cache}
+
+def remember_track_details(songs):
+    """Keep the details of full catalog song resources from a response, sparing a details request"""
+    with track_details_lock:
+        for song in songs:
+            if song.get('attributes', {}).get('name'):
+                track_details_cache[song['id']] = parse_track_details(song)
 
 def write_error_report(filename, failed_tracks):
     """Write a detailed HTML error report for failed tracks with corrected app links"""
@@ -255,289 +1410,567 @@ def write_error_report(filename, failed_tracks):
     with open(filename, 'w', encoding='utf-8') as f:
         f.write(html_content)
 
-def add_to_library(session, song_id):
-    """Add a song to the user's Apple Music library"""
-    url = "https://amp-api.music.apple.com/v1/me/library"
-    data = {
-        "data": [{
-            "id": str(song_id),
-            "type": "songs"
-        }]
-    }
-    
+@instrumented
+def add_songs_to_library(session, song_ids):
+    """Add several songs to the user's Apple Music library in one request"""
     try:
-        response = session.post(url, json=data)
-        return "OK" if response.status_code in [200, 201, 204] else "ERROR"
+        response = session.post(f"{amp_api_url}/v1/me/library", params={"ids[songs]": ",".join(str(song_id) for song_id in song_ids)})
+        if response.status_code in [200, 201, 202, 204]:
+            return "OK"
+        elif response.status_code in [401, 403]:
+            return "UNAUTHORIZED"
+        else:
+            return "ERROR"
     except Exception:
         return "ERROR"
 
-def process_songs(file, mode='playlist'):
-    """Process songs with support for library mode"""
-    failed_tracks = []
-    
-    # Prevent sleep on macOS if possible
-    if caffeine_enabled:
-        caffeine.on(display=True)
-    
-    try:
-        with requests.Session() as s:
-            s.headers.update({
-                "Authorization": f"{token}",
-                "media-user-token": f"{media_user_token}",
-                "Cookie": f"{cookies}".encode('utf-8'),
-                "Host": "amp-api.music.apple.com",
-                "Accept-Encoding": "gzip, deflate, br",
-                "Referer": "https://music.apple.com/",
-                "Origin": "https://music.apple.com",
-                "Connection": "keep-alive",
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "same-site",
-            })
-            
-            playlist_identifier = None
-            playlist_track_ids = []
-            playlist_name = None
-            
-            if mode == 'playlist':
-                playlist_name = os.path.basename(file).split('.')[0].replace('_', ' ').capitalize()
-                playlist_identifier = create_apple_music_playlist(s, playlist_name)
-                playlist_track_ids = get_playlist_track_ids(s, playlist_identifier)
-            
-            # Count total tracks first
-            with open(str(file), encoding='utf-8') as csvfile:
-                total_tracks = sum(1 for row in csv.reader(csvfile)) - 1  # Subtract header row
-            
-            # Initialize progress bar
-            progress = tqdm(
-                total=total_tracks,
-                desc="Processing tracks",
-                unit="track",
-                bar_format='{desc}: {percentage:3.0f}% |{bar}| {n_fmt}/{total_fmt} (Time remaining: {remaining})'
-            )
-            
-            matched = 0
-            failed = 0
-            
-            with open(str(file), encoding='utf-8') as csvfile:
-                file_reader = csv.reader(csvfile)
-                header_row = next(file_reader)
-                
-                if header_row[1] != 'Track Name' or header_row[3] != 'Artist Name(s)' or header_row[5] != 'Album Name' or header_row[16] != 'ISRC':
-                    print('\nThe CSV file is not in the correct format!\nPlease be sure to download the CSV file(s) only from https://watsonbox.github.io/exportify/.\n\n')
-                    return
-                
-                for row in file_reader:
-                    title, artist, album, album_artist, isrc = [clean_string(x) for x in [row[1], row[3], row[5], row[7], row[16]]]
-                    
-                    # Update progress description
-                    progress.set_description(f"Processing {title[:30]}{'...' if len(title) > 30 else ''}")
-                    
-                    # Try ISRC first
-                    track_id = None
-                    if isrc:
-                        track_id = match_isrc_to_itunes_id(s, album, album_artist, isrc)
-                    
-                    # If ISRC fails, try text search
-                    if not track_id:
-                        match_result = get_itunes_id(title, artist, album, s)
-                        if match_result.track_id:
-                            track_id = match_result.track_id
-                    
-                    if track_id:
-                        if mode == 'playlist':
-                            result = add_song_to_playlist(s, track_id, playlist_identifier, playlist_track_ids, playlist_name)
-                        elif mode == 'like':
-                            result = like_track(s, track_id)
-                        else:  # library mode
-                            result = add_to_library(s, track_id)
-                            
-                        if result == "OK":
-                            matched += 1
-                        else:
-                            failed += 1
-                            failed_tracks.append({
-                                'title': title,
-                                'artist': artist,
-                                'album': album,
-                                'isrc': isrc,
-                                'error': 'Failed to process'
-                            })
-                    else:
-                        failed += 1
-                        failed_tracks.append({
-                            'title': title,
-                            'artist': artist,
-                            'album': album,
-                            'isrc': isrc,
-                            'alternatives': match_result.alternative_matches if 'match_result' in locals() else []
-                        })
-                    
-                    progress.update(1)
-                    sleep(delay)
-            
-            progress.close()
-            
-            # Generate report
-            success_rate = (matched / total_tracks) * 100 if total_tracks > 0 else 0
-            print(f"\n=== Processing Complete ===")
-            print(f"Total tracks: {total_tracks}")
-            print(f"Successfully processed: {matched}")
-            print(f"Failed: {failed}")
-            print(f"Success rate: {success_rate:.1f}%")
-            
-            action_type = {
-                'playlist': 'added to playlist',
-                'like': 'liked',
-                'library': 'added to library'
-            }[mode]
-            print(f"Tracks were {action_type}")
-            
-            if failed_tracks:
-                report_filename = f"{os.path.splitext(file)[0]}_failed_tracks.html"
-                write_error_report(report_filename, failed_tracks)
-                print(f"\nGenerated error report: {report_filename}")
-    
-    finally:
-        # Re-enable sleep if we disabled it
-        if caffeine_enabled:
-            caffeine.off()
-
-def add_song_to_playlist(session, song_id, playlist_id, playlist_track_ids=None, playlist_name=None):
-    """Add a song to an Apple Music playlist"""
-    song_id = str(song_id)
-    equivalent_song_id = fetch_equivalent_song_id(session, song_id)
-    
-    if equivalent_song_id != song_id:
-        if playlist_track_ids and equivalent_song_id in playlist_track_ids:
-            return "DUPLICATE"
-        song_id = equivalent_song_id
-    
+@instrumented
+def add_songs_to_playlist(session, song_ids, playlist_id):
+    """Add several songs to an Apple Music playlist in one request"""
     try:
         request = session.post(
-            f"https://amp-api.music.apple.com/v1/me/library/playlists/{playlist_id}/tracks",
-            json={"data": [{"id": f"{song_id}", "type": "songs"}]}
+            f"{amp_api_url}/v1/me/library/playlists/{playlist_id}/tracks",
+            json={"data": [{"id": f"{song_id}", "type": "songs"} for song_id in song_ids]}
         )
         
         if request.status_code in [200, 201, 204]:
             return "OK"
+        elif request.status_code in [401, 403]:
+            return "UNAUTHORIZED"
         else:
             return "ERROR"
     except Exception:
         return "ERROR"
 
-def fetch_equivalent_song_id(session, song_id):
-    """Fetch equivalent song ID if available"""
-    try:
-        request = session.get(f"https://amp-api.music.apple.com/v1/catalog/{country_code}/songs?filter[equivalents]={song_id}")
-        if request.status_code == 200:
-            data = json.loads(request.content.decode('utf-8'))
-            return data['data'][0]['id']
-        else:
-            return song_id
-    except:
-        return song_id
+class ChunkedWriter:
+    """Queue per-row outcomes and write matched songs in chunks, keeping input order"""
+    def __init__(self, session, chunk_size):
+        self.session = session
+        self.chunk_size = chunk_size
+        self.pending = []
+        self.queued = 0
+    
+    def add(self, track, song_id=None, result=None):
+        """Queue a row; rows without a result are written. Returns the outcomes of any flushed chunk"""
+        self.pending.append([track, str(song_id) if song_id is not None else None, result])
+        if result is None:
+            self.queued += 1
+            if self.queued >= self.chunk_size:
+                return self.flush()
+        return []
+    
+    def flush(self):
+        """Write the queued songs and return (track, result) pairs in input order"""
+        song_ids = [song_id for _, song_id, result in self.pending if result is None]
+        results = self.write_chunk(song_ids) if song_ids else {}
+        outcomes = [(track, result if result is not None else results.get(song_id, "ERROR"))
+                    for track, song_id, result in self.pending]
+        self.pending = []
+        self.queued = 0
+        return outcomes
+    
+    def write_chunk(self, song_ids):
+        """Write song_ids and return a result for each of them"""
+        raise NotImplementedError
+    
+    def write_with_bisect(self, song_ids, write, retries=0):
+        """Write song_ids, splitting failed chunks until the failing songs are isolated
+        
+        A single failing song is tried again up to retries times, which is only safe
+        for writes that can be repeated without effect.
+        """
+        result = write(song_ids)
+        if len(song_ids) == 1:
+            for attempt in range(retries):
+                if result != "ERROR":
+                    break
+                result = write(song_ids)
+        if result == "OK":
+            return {song_id: "OK" for song_id in song_ids}
+        # Expired credentials fail every request, so splitting would not help
+        if len(song_ids) == 1 or result == "UNAUTHORIZED":
+            return {song_id: "ERROR" for song_id in song_ids}
+        middle = len(song_ids) // 2
+        results = self.write_with_bisect(song_ids[:middle], write, retries)
+        results.update(self.write_with_bisect(song_ids[middle:], write, retries))
+        return results
 
-def get_playlist_track_ids(session, playlist_id):
-    """Get all track IDs from a playlist"""
+class PlaylistWriter(ChunkedWriter):
+    """Add matched songs to a playlist in chunks instead of one request per song"""
+    def __init__(self, session, playlist_id, playlist_track_ids=None, chunk_size=None):
+        super().__init__(session, chunk_size or playlist_chunk_size)
+        self.playlist_id = playlist_id
+        self.playlist_track_ids = set(playlist_track_ids or ())
+    
+    def flush(self):
+        # Resolve the storefront equivalents of the whole chunk at once
+        song_ids = [str(song_id) for _, song_id, result in self.pending if result is None]
+        equivalents = fetch_equivalent_song_ids(self.session, song_ids)
+        
+        queued_ids = set()
+        for entry in self.pending:
+            if entry[2] is not None:
+                continue
+            song_id = str(entry[1])
+            equivalent_song_id = equivalents.get(song_id, song_id)
+            
+            if song_id in self.playlist_track_ids or equivalent_song_id in self.playlist_track_ids or equivalent_song_id in queued_ids:
+                entry[2] = "DUPLICATE"
+            queued_ids.add(equivalent_song_id)
+            entry[1] = equivalent_song_id
+            # Sync mode keeps the playlist tracks of both IDs (see PlaylistIndex.library_ids_missing_from)
+            if equivalent_song_id != song_id:
+                entry[0]['equivalent_id'] = equivalent_song_id
+        return super().flush()
+    
+    def write_chunk(self, song_ids):
+        results = self.write_with_bisect(
+            song_ids,
+            lambda chunk: add_songs_to_playlist(self.session, chunk, self.playlist_id)
+        )
+        # Keep the index current, so a later chunk or re-run won't add these again
+        self.playlist_track_ids.update(song_id for song_id, result in results.items() if result == "OK")
+        return results
+
+class LibraryWriter(ChunkedWriter):
+    """Add matched songs to the library through the multi-ID endpoint, a chunk per request"""
+    def __init__(self, session, chunk_size=None):
+        super().__init__(session, chunk_size or library_chunk_size)
+    
+    def write_chunk(self, song_ids):
+        # Adding a song twice is harmless, so single songs are retried
+        return self.write_with_bisect(
+            list(dict.fromkeys(str(song_id) for song_id in song_ids)),
+            lambda chunk: add_songs_to_library(self.session, chunk),
+            write_retries
+        )
+
+class LikeWriter(ChunkedWriter):
+    """Like matched songs a chunk at a time, sending the ratings of a chunk concurrently"""
+    def __init__(self, session, chunk_size=None):
+        super().__init__(session, chunk_size or like_concurrency * 4)
+    
+    def write_chunk(self, song_ids):
+        song_ids = list(dict.fromkeys(str(song_id) for song_id in song_ids))
+        
+        def like(song_id):
+            # A rating can be set again without effect, so failures are retried
+            for attempt in range(write_retries + 1):
+                result = like_track(self.session, song_id)
+                if result != "ERROR":
+                    break
+            return "OK" if result == "OK" else "ERROR"
+        
+        with ThreadPoolExecutor(max_workers=min(like_concurrency, len(song_ids))) as executor:
+            return dict(zip(song_ids, executor.map(like, song_ids)))
+
+class MatchOnlyWriter:
+    """Writer of the match mode: nothing is sent, the matches go to a mapping file (see write_mapping)"""
+    def add(self, track, song_id=None, result=None):
+        return [(track, "OK" if song_id else result)]
+    
+    def flush(self):
+        return []
+
+def mapping_path(file):
+    """Path of the mapping file the match mode writes for a CSV"""
+    return f"{os.path.splitext(file)[0]}.mapping.csv"
+
+def write_mapping(path, entries):
+    """Write the matches of journal entries, given in row order, as a CSV keyed by Spotify track URI
+    
+    The file can be converted like any Exportify CSV: its rows need no matching, except those
+    whose lookup failed or that were matched for another storefront.
+    """
+    with open(path, 'w', encoding='utf-8', newline='') as mapping:
+        writer = csv.writer(mapping)
+        # The matching fields are kept too, for the rows that are matched again
+        writer.writerow(['Track URI', 'Track Name', 'Artist Name(s)', 'Album Name', 'Album Artist Name(s)', 'ISRC',
+                         'Track Duration (ms)', 'Explicit', 'Apple Music ID', 'Confidence', 'Match Method', 'Storefront'])
+        for entry in entries:
+            track = entry['track']
+            # Rows whose lookup failed get no method, so they are matched again
+            if track.get('track_id'):
+                method = track.get('match_method') or 'unknown'
+            else:
+                method = '' if track.get('lookup_errors') else 'none'
+            explicit = track.get('explicit')
+            writer.writerow([
+                track['uri'], track.get('raw_title', track['title']), track.get('raw_artist', track['artist']),
+                track['album'], track.get('album_artist', ''), track['isrc'].upper(), track.get('duration') or '',
+                '' if explicit is None else str(explicit).lower(),
+                track.get('track_id') or '', track.get('confidence', ''), method, country_code
+            ])
+
+# Equivalents fetched during this run, keyed by storefront and song ID
+equivalents_memo = LookupMemo('fetch_equivalent_song_ids')
+
+@instrumented
+def fetch_equivalent_song_ids(session, song_ids):
+    """Fetch equivalent song IDs for many songs, from this run's and the on-disk cache first"""
+    song_ids = list(dict.fromkeys(str(song_id) for song_id in song_ids))
+    equivalents = {
+        song_id: equivalent_id for (_, song_id), equivalent_id
+        in equivalents_memo.get_many([(country_code, song_id) for song_id in song_ids]).items()
+    }
+    song_ids = [song_id for song_id in song_ids if song_id not in equivalents]
+    if equivalence_cache:
+        equivalents.update(equivalence_cache.get_many(country_code, song_ids))
+    missing = [song_id for song_id in song_ids if song_id not in equivalents]
+    if equivalence_cache:
+        run_metrics.record_cache('equivalents', hits=len(equivalents), misses=len(missing))
+    fetched = {}
+    
+    for start in range(0, len(missing), equivalents_batch_size):
+        batch = missing[start:start + equivalents_batch_size]
+        try:
+            request = session.get(f"{amp_api_url}/v1/catalog/{country_code}/songs?filter[equivalents]={','.join(batch)}")
+            data = json.loads(request.content.decode('utf-8'))['data'] if request.status_code == 200 else []
+        except Exception:
+            data = []
+        
+        # The results come in no guaranteed order, so each is tied to a requested song by what it
+        # carries: its own ID, or an ISRC only one requested song (per the details fetched) has
+        returned_ids = {each['id'] for each in data}
+        unresolved = []
+        for song_id in batch:
+            if song_id in returned_ids:
+                fetched[song_id] = song_id
+            else:
+                unresolved.append(song_id)
+        with track_details_lock:
+            isrcs = {song_id: ((track_details_cache.get(song_id) or {}).get('isrc') or '').upper() for song_id in unresolved}
+        requested_by_isrc = defaultdict(list)
+        for song_id, isrc in isrcs.items():
+            if isrc:
+                requested_by_isrc[isrc].append(song_id)
+        returned_by_isrc = defaultdict(list)
+        for each in data:
+            if each['id'] not in fetched:
+                returned_by_isrc[(each.get('attributes', {}).get('isrc') or '').upper()].append(each['id'])
+        for isrc, requested in requested_by_isrc.items():
+            if len(requested) == 1 and len(returned_by_isrc.get(isrc, [])) == 1:
+                fetched[requested[0]] = returned_by_isrc[isrc][0]
+        
+        # Whatever is left is looked up on its own, where the answer is unambiguous
+        for song_id in unresolved:
+            if song_id in fetched:
+                continue
+            try:
+                request = session.get(f"{amp_api_url}/v1/catalog/{country_code}/songs?filter[equivalents]={song_id}")
+                if request.status_code == 200:
+                    fetched[song_id] = json.loads(request.content.decode('utf-8'))['data'][0]['id']
+            except Exception:
+                continue
+    
+    if equivalence_cache and fetched:
+        equivalence_cache.set_many(country_code, fetched)
+    equivalents.update(fetched)
+    equivalents_memo.set_many({(country_code, song_id): equivalent_id for song_id, equivalent_id in equivalents.items()})
+    return equivalents
+
+def get_playlist_tracks(session, playlist_id):
+    """Get every library track of a playlist, following all pages"""
     try:
-        response = session.get(f"https://amp-api.music.apple.com/v1/me/library/playlists/{playlist_id}/tracks")
-        if response.status_code == 200:
-            return [track['attributes']['playParams']['catalogId'] for track in response.json()['data']]
-        elif response.status_code == 404:
+        status_code, tracks = fetch_all_pages(session, f"/v1/me/library/playlists/{playlist_id}/tracks")
+        if status_code == 200:
+            return tracks
+        elif status_code == 404:  # Empty playlist
             return []
         else:
-            raise Exception(f"Error {response.status_code} while getting playlist {playlist_id}!")
+            raise Exception(f"Error {status_code} while getting playlist {playlist_id}!")
     except Exception as e:
         print(f"Error getting playlist tracks: {e}")
         return []
 
-def enhance_itunes_match(search_results, title, artist, album, session):
-    """Enhanced matching logic with confidence scoring and alternative matches"""
-    matches = []
+def get_playlist_track_ids(session, playlist_id):
+    """Get the set of catalog IDs in a playlist"""
+    return {
+        str(track['attributes']['playParams']['catalogId'])
+        for track in get_playlist_tracks(session, playlist_id)
+        if track.get('attributes', {}).get('playParams', {}).get('catalogId')
+    }
+
+def sync_key(title, artist):
+    """Normalized title/artist key used to spot tracks a playlist already has"""
+    return f"{clean_string(remove_features(title))}|{clean_string(artist)}"
+
+class PlaylistIndex:
+    """What a remote playlist already holds, by catalog ID, ISRC and title/artist"""
+    def __init__(self, tracks, details):
+        self.catalog_ids = set()
+        self.library_ids_by_isrc = defaultdict(list)
+        self.library_ids_by_key = defaultdict(list)
+        self.library_ids_by_catalog_id = defaultdict(list)
+        # Without every track's details, tracks may be missing from the ISRC index
+        self.complete = True
+        for track in tracks:
+            attributes = track.get('attributes', {})
+            catalog_id = str(attributes.get('playParams', {}).get('catalogId') or '')
+            if catalog_id:
+                self.catalog_ids.add(catalog_id)
+                self.library_ids_by_catalog_id[catalog_id].append(track['id'])
+                if catalog_id not in details:
+                    self.complete = False
+            isrc = (details.get(catalog_id) or {}).get('isrc')
+            if isrc:
+                self.library_ids_by_isrc[isrc.upper()].append(track['id'])
+            self.library_ids_by_key[sync_key(attributes.get('name'), attributes.get('artistName'))].append(track['id'])
+    
+    def contains(self, isrc, key):
+        return (isrc and isrc.upper() in self.library_ids_by_isrc) or key in self.library_ids_by_key
     
+    def library_ids_missing_from(self, isrcs, keys, catalog_ids=()):
+        """Library track IDs whose catalog ID, ISRC and title/artist are all absent from the CSV"""
+        keep = set()
+        for catalog_id in catalog_ids:
+            keep.update(self.library_ids_by_catalog_id.get(str(catalog_id), []))
+        for isrc in isrcs:
+            keep.update(self.library_ids_by_isrc.get(isrc.upper(), []))
+        for key in keys:
+            keep.update(self.library_ids_by_key.get(key, []))
+        all_ids = {library_id for ids in self.library_ids_by_key.values() for library_id in ids}
+        return sorted(all_ids - keep)
+
+def load_playlist_index(session, playlist_id):
+    """Read a remote playlist once and index it for sync mode"""
+    tracks = get_playlist_tracks(session, playlist_id)
+    catalog_ids = [
+        track['attributes']['playParams']['catalogId']
+        for track in tracks
+        if track.get('attributes', {}).get('playParams', {}).get('catalogId')
+    ]
+    # The library resources have no ISRC, the catalog ones do
+    details = get_tracks_details(catalog_ids, session)
+    return PlaylistIndex(tracks, details)
+
+@instrumented
+def remove_playlist_tracks(session, playlist_id, library_ids):
+    """Remove library tracks from a playlist, returning how many were removed"""
+    def remove(library_id):
+        try:
+            response = session.delete(
+                f"{amp_api_url}/v1/me/library/playlists/{playlist_id}/tracks",
+                params={"ids[library-songs]": library_id, "mode": "all"}
+            )
+            return response.status_code in [200, 202, 204]
+        except Exception:
+            return False
+    
+    if not library_ids:
+        return 0
+    with ThreadPoolExecutor(max_workers=min(workers, len(library_ids))) as executor:
+        return sum(executor.map(remove, library_ids))
+
+def score_search_results(search_results, title, artist, album):
+    """Score search results against a track, best first, as (confidence, result) pairs"""
+    # Each string is normalized once here and compared as is
     normalized_search_title = clean_string(remove_features(title))
     normalized_search_artist = clean_string(artist)
     normalized_search_album = clean_string(album)
     
-    for result in search_results:
-        result_title = clean_string(remove_features(result['trackName']))
-        result_artist = clean_string(result['artistName'])
-        result_album = clean_string(result['collectionName'])
-        
-        # Calculate individual similarity scores
-        title_score = get_string_similarity(normalized_search_title, result_title)
-        artist_score = get_string_similarity(normalized_search_artist, result_artist)
-        album_score = get_string_similarity(normalized_search_album, result_album)
-        
+    # Calculate individual similarity scores, each field against all results at once
+    title_scores = score_similarities(normalized_search_title, [
+        clean_string(remove_features(result['trackName'])) for result in search_results
+    ])
+    artist_scores = score_similarities(normalized_search_artist, [
+        clean_string(result['artistName']) for result in search_results
+    ])
+    album_scores = score_similarities(normalized_search_album, [
+        clean_string(result['collectionName']) for result in search_results
+    ])
+    
+    scored = []
+    for result, title_score, artist_score, album_score in zip(search_results, title_scores, artist_scores, album_scores):
         # Weighted scoring
         total_score = (title_score * 0.5) + (artist_score * 0.3) + (album_score * 0.2)
-        
-        # Get detailed track info for potential matches
-        track_details = get_track_details(result['trackId'], session)
-        if track_details:
-            matches.append({
-                'id': result['trackId'],
-                'confidence': total_score,
-                'details': track_details
-            })
+        scored.append((total_score, result))
+    
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return scored
+
+def filter_candidates(search_results, duration=None, isrc=None):
+    """Pre-filter search results on the CSV's ISRC and duration, before any string is compared
+    
+    Returns (results, exact): a result with the row's ISRC is taken at once, otherwise results
+    whose duration is off by more than duration_tolerance_ms are left out. Results that don't
+    say are kept.
+    """
+    if isrc:
+        exact = [result for result in search_results if (result.get('isrc') or '').upper() == isrc.upper()]
+        if exact:
+            with strategy_stats_lock:
+                candidate_stats['isrc'] += len(search_results) - 1
+            return exact[:1], True
+    
+    if duration and duration_tolerance_ms:
+        kept = [
+            result for result in search_results
+            if not result.get('trackTimeMillis') or abs(result['trackTimeMillis'] - duration) <= duration_tolerance_ms
+        ]
+        if len(kept) < len(search_results):
+            with strategy_stats_lock:
+                candidate_stats['duration'] += len(search_results) - len(kept)
+            search_results = kept
+    return search_results, False
+
+def rank_candidates(search_results, title, artist, album, duration=None, explicit=None, isrc=None):
+    """Pre-filter and score search results, best first, as (confidence, result) pairs
+    
+    Among results scoring the same, the version whose explicitness matches the CSV's comes first.
+    """
+    candidates, exact = filter_candidates(search_results, duration, isrc)
+    if exact:
+        return [(1.0, candidates[0])]
+    scored = score_search_results(candidates, title, artist, album)
+    
+    if explicit is not None and len(scored) > 1:
+        def explicitness_differs(result):
+            marked = result.get('trackExplicitness')
+            return marked in ('explicit', 'notExplicit', 'cleaned') and (marked == 'explicit') != explicit
+        best = scored[0]
+        # Only exact ties are reordered (up to float noise), and never across the match threshold
+        scored.sort(key=lambda x: (x[0] < 0.8, -round(x[0], 9), explicitness_differs(x[1])))
+        if scored[0] is not best:
+            with strategy_stats_lock:
+                candidate_stats['explicit'] += 1
+    return scored
+
+def enhance_itunes_match(search_results, title, artist, album, session, duration=None, explicit=None, isrc=None):
+    """Enhanced matching logic with confidence scoring and alternative matches"""
+    matches = []
+    
+    # Sort candidates by confidence, then only fetch details for the best few
+    scored = rank_candidates(search_results, title, artist, album, duration, explicit, isrc)
     
-    # Sort matches by confidence
-    matches.sort(key=lambda x: x['confidence'], reverse=True)
+    errors = 0
+    for start in range(0, len(scored), enrich_top_k):
+        window = scored[start:start + enrich_top_k]
+        details = get_tracks_details([result['trackId'] for _, result in window], session)
+        for total_score, result in window:
+            if str(result['trackId']) not in details:
+                errors += 1
+            track_details = details.get(str(result['trackId']))
+            if track_details:
+                matches.append({
+                    'id': result['trackId'],
+                    'name': track_details['name'],
+                    'artist': track_details['artist'],
+                    'confidence': total_score,
+                    'details': track_details
+                })
+        # Enough candidates for the best match and its alternatives
+        if len(matches) >= enrich_top_k:
+            break
     
     if matches:
         best_match = matches[0]
-        alternative_matches = matches[1:4]  # Keep top 3 alternatives
+        alternative_matches = matches[1:enrich_top_k]  # Keep top 3 alternatives
         
         if best_match['confidence'] >= 0.8:
             return MatchResult(
                 track_id=best_match['id'],
                 confidence=best_match['confidence'],
                 match_method='high_confidence',
-                alternative_matches=alternative_matches
+                alternative_matches=alternative_matches,
+                errors=errors
             )
         else:
             return MatchResult(
                 confidence=best_match['confidence'],
-                alternative_matches=matches[:4]  # Include best match in alternatives
+                alternative_matches=matches[:enrich_top_k],  # Include best match in alternatives
+                errors=errors
             )
     
-    return MatchResult()
+    return MatchResult(errors=errors)
+
+def record_strategy(strategy, outcome):
+    """Count how often a match strategy is tried, skipped as a duplicate, or wins"""
+    with strategy_stats_lock:
+        strategy_stats[strategy][outcome] += 1
 
-def get_itunes_id(title, artist, album, s):
-    """Enhanced version of get_itunes_id with improved matching"""
-    BASE_URL = f"https://itunes.apple.com/search?country={country_code}&media=music&entity=song&limit=10&term="
+def print_strategy_stats():
+    """Print the hit rate of each match strategy, to help tune their order"""
+    if not strategy_stats:
+        return
+    print("\n=== Match Strategies ===")
+    for strategy, counts in sorted(strategy_stats.items(), key=lambda item: -item[1]['tried']):
+        tried = counts['tried']
+        hit_rate = (counts['matched'] / tried) * 100 if tried else 0
+        skipped = f", {counts['skipped']} duplicate queries skipped" if counts['skipped'] else ""
+        print(f"{strategy}: {counts['matched']}/{tried} matched ({hit_rate:.1f}%){skipped}")
+    if candidate_stats:
+        print(f"Search results left out before scoring: {candidate_stats['duration']} on duration, "
+              f"{candidate_stats['isrc']} beside an ISRC match; "
+              f"{candidate_stats['explicit']} ties decided on explicitness")
+
+def match_locally(title, artist, album, duration=None, explicit=None, isrc=None):
+    """Confidently match a track from the local catalog, or return None"""
+    record_strategy('local', 'tried')
+    scored = rank_candidates(local_catalog.search(country_code, title, artist, local_search_limit), title, artist, album,
+                             duration, explicit, isrc)
+    if scored and scored[0][0] >= 0.8:
+        local_catalog.count(hit=True)
+        record_strategy('local', 'matched')
+        return MatchResult(track_id=scored[0][1]['trackId'], confidence=scored[0][0], match_method='local')
+    local_catalog.count(hit=False)
+    return None
+
+@memoized(key=lambda title, artist, album, s, duration=None, explicit=None, isrc=None:
+          (title, artist, album, duration, explicit, (isrc or '').upper()),
+          keep=lambda result: result.track_id or not result.errors)
+@instrumented
+def get_itunes_id(title, artist, album, s, duration=None, explicit=None, isrc=None):
+    """Enhanced version of get_itunes_id with improved matching
     
+    The CSV's duration, explicitness and ISRC, when given, narrow the search results down
+    before they are scored (see filter_candidates).
+    """
     try:
-        # Different search strategies
+        # Songs seen in earlier responses often match without searching at all
+        if local_catalog and use_local_catalog:
+            local_match = match_locally(title, artist, album, duration, explicit, isrc)
+            if local_match:
+                return local_match
+        
+        # Different search strategies, tried in order until one is confident
         search_strategies = [
-            (title, artist, album),  # Full search
-            (remove_features(title), artist, album),  # Without features
-            (title, artist, ""),  # Without album
-            (remove_features(title), artist, ""),  # Without features and album
-            (title, "", album),  # Without artist
-            (remove_features(title), "", "")  # Title only, without features
+            ('full', (title, artist, album)),
+            ('no_features', (remove_features(title), artist, album)),
+            ('no_album', (title, artist, "")),
+            ('no_features_no_album', (remove_features(title), artist, "")),
+            ('no_artist', (title, "", album)),
+            ('title_only', (remove_features(title), "", ""))
         ]
         
         best_match = None
         highest_confidence = 0
         all_alternatives = []
+        sent_terms = set()
+        errors = 0
         
-        for search_title, search_artist, search_album in search_strategies:
+        for strategy, (search_title, search_artist, search_album) in search_strategies:
             if not search_album and not search_artist:
-                url = BASE_URL + urllib.parse.quote(search_title)
+                term = search_title
             elif not search_album:
-                url = BASE_URL + urllib.parse.quote(f"{search_title} {search_artist}")
+                term = f"{search_title} {search_artist}"
             else:
-                url = BASE_URL + urllib.parse.quote(f"{search_title} {search_artist} {search_album}")
+                term = f"{search_title} {search_artist} {search_album}"
+            
+            # An earlier strategy already sent this exact query
+            if term in sent_terms:
+                record_strategy(strategy, 'skipped')
+                continue
+            sent_terms.add(term)
+            record_strategy(strategy, 'tried')
             
             try:
-                request = urllib.request.Request(url)
-                response = urllib.request.urlopen(request)
-                data = json.loads(response.read().decode('utf-8'))
+                results = search_songs(s, term)
                 
-                if data['resultCount'] > 0:
-                    match_result = enhance_itunes_match(data['results'], search_title, search_artist, search_album, s)
+                if results:
+                    match_result = enhance_itunes_match(results, search_title, search_artist, search_album, s,
+                                                        duration, explicit, isrc)
+                    errors += match_result.errors
                     
                     if match_result.confidence > highest_confidence:
                         best_match = match_result
@@ -547,198 +1980,1009 @@ def get_itunes_id(title, artist, album, s):
                     for alt in match_result.alternative_matches:
                         if alt not in all_alternatives:
                             all_alternatives.append(alt)
+                    
+                    # Stop at the first confident match
+                    if match_result.track_id:
+                        match_result.match_method = strategy
+                        record_strategy(strategy, 'matched')
+                        break
             except:
+                errors += 1
                 continue
         
         if best_match and best_match.track_id:
             best_match.alternative_matches = all_alternatives
             return best_match
         
-        return MatchResult(alternative_matches=all_alternatives)
+        return MatchResult(alternative_matches=all_alternatives, errors=errors)
         
     except Exception:
-        return MatchResult()
+        return MatchResult(errors=1)
+
+def select_isrc_match(candidates, album, album_artist):
+    """Pick the ISRC candidate whose album and artist match the (normalized) track"""
+    for each in candidates:
+        isrc_album_name = clean_string(each['attributes']['albumName'])
+        isrc_artist_name = clean_string(each['attributes']['artistName'])
+        
+        # Calculate similarity scores
+        album_score = get_normalized_similarity(isrc_album_name, album)
+        artist_score = get_normalized_similarity(isrc_artist_name, album_artist)
+        
+        # If both scores are high enough, consider it a match
+        if album_score > 0.8 and artist_score > 0.8:
+            return each['id']
+        # If one score is very high and the other is reasonable
+        elif (album_score > 0.9 and artist_score > 0.6) or (artist_score > 0.9 and album_score > 0.6):
+            return each['id']
+        # If album matches exactly
+        elif isrc_album_name == album:
+            return each['id']
+    
+    return None
 
+@memoized(key=lambda session, album, album_artist, isrc: (album, album_artist, isrc.upper()), keep=lambda result: True)
+@instrumented
 def match_isrc_to_itunes_id(session, album, album_artist, isrc):
-    """Match track using ISRC code"""
-    BASE_URL = f"https://amp-api.music.apple.com/v1/catalog/{country_code}/songs?filter[isrc]={isrc}"
+    """Match track using ISRC code, raising if the lookup itself fails"""
+    if local_catalog and use_local_catalog:
+        candidates = local_catalog.isrc_candidates(country_code, isrc)
+        local_catalog.count(hit=candidates is not None)
+        if candidates is not None:
+            return select_isrc_match(candidates, album, album_artist)
+    
+    BASE_URL = f"{amp_api_url}/v1/catalog/{country_code}/songs?filter[isrc]={isrc}"
     try:
         request = session.get(BASE_URL)
         if request.status_code == 200:
             data = json.loads(request.content.decode('utf-8'))
         else:
             raise Exception(f"Error {request.status_code}: {request.reason}")
+        remember_catalog_songs(data.get('data', []), [isrc])
+        remember_track_details(data.get('data', []))
             
         if not data.get("data"):
             return None
             
         # Try to match the song with the results
-        for each in data['data']:
-            isrc_album_name = clean_string(each['attributes']['albumName'])
-            isrc_artist_name = clean_string(each['attributes']['artistName'])
-            
-            # Calculate similarity scores
-            album_score = get_string_similarity(isrc_album_name, clean_string(album))
-            artist_score = get_string_similarity(isrc_artist_name, clean_string(album_artist))
-            
-            # If both scores are high enough, consider it a match
-            if album_score > 0.8 and artist_score > 0.8:
-                return each['id']
-            # If one score is very high and the other is reasonable
-            elif (album_score > 0.9 and artist_score > 0.6) or (artist_score > 0.9 and album_score > 0.6):
-                return each['id']
-            # If album matches exactly
-            elif isrc_album_name == clean_string(album):
-                return each['id']
-                
-        return None
+        return select_isrc_match(data['data'], album, album_artist)
     except Exception as e:
+        # Unlike a miss, a failed lookup (e.g. expired tokens) must be retried on resume
         print(f"ISRC search failed: {e}")
+        raise
+
+@instrumented
+def fetch_isrc_candidates(session, isrcs):
+    """Look up catalog songs for many ISRCs at once, grouped by ISRC"""
+    candidates = {}
+    isrcs = list(dict.fromkeys(isrc.upper() for isrc in isrcs if isrc))
+    
+    # The local catalog answers for the ISRCs it knows every song of
+    if local_catalog and use_local_catalog:
+        for isrc in isrcs:
+            local_candidates = local_catalog.isrc_candidates(country_code, isrc)
+            local_catalog.count(hit=local_candidates is not None)
+            if local_candidates is not None:
+                candidates[isrc] = local_candidates
+        isrcs = [isrc for isrc in isrcs if isrc not in candidates]
+    
+    for start in range(0, len(isrcs), isrc_batch_size):
+        batch = isrcs[start:start + isrc_batch_size]
+        url = f"{amp_api_url}/v1/catalog/{country_code}/songs?filter[isrc]={','.join(batch)}"
+        try:
+            request = session.get(url)
+            if request.status_code == 200:
+                data = json.loads(request.content.decode('utf-8'))
+            else:
+                raise Exception(f"Error {request.status_code}: {request.reason}")
+        except Exception as e:
+            # Leave the batch out so its rows fall back to single lookups
+            print(f"Batch ISRC search failed: {e}")
+            continue
+        
+        remember_catalog_songs(data.get('data', []), batch)
+        remember_track_details(data.get('data', []))
+        # Every requested ISRC is resolved now, even those without results
+        for isrc in batch:
+            candidates[isrc] = []
+        for each in data.get('data', []):
+            isrc = each.get('attributes', {}).get('isrc', '').upper()
+            if isrc in candidates:
+                candidates[isrc].append(each)
+    
+    return candidates
+
+def find_album(session, album, album_artist):
+    """Find the catalog album with a (normalized) name and artist, or return None"""
+    response = session.get(
+        f"{amp_api_url}/v1/catalog/{country_code}/search",
+        params={"types": "albums", "term": f"{album} {album_artist}", "limit": search_limit}
+    )
+    if response.status_code != 200:
+        raise Exception(f"Error {response.status_code}: {response.reason}")
+    albums = json.loads(response.content.decode('utf-8')).get('results', {}).get('albums', {}).get('data', [])
+    
+    best_album, best_score = None, 0
+    for each in albums:
+        album_score = get_normalized_similarity(clean_string(each['attributes']['name']), album)
+        artist_score = get_normalized_similarity(clean_string(each['attributes']['artistName']), album_artist)
+        if album_score > 0.8 and artist_score > 0.8 and album_score + artist_score > best_score:
+            best_album, best_score = each['id'], album_score + artist_score
+    return best_album
+
+@instrumented
+def get_album_tracks(session, album, album_artist):
+    """Tracklist of an album as iTunes-shaped results, resolved once per run, or None"""
+    key = (album, album_artist)
+    with album_tracks_lock:
+        if key in album_tracks_cache:
+            run_metrics.record_cache('album_tracks', hit=True)
+            return album_tracks_cache[key]
+    run_metrics.record_cache('album_tracks', hit=False)
+    
+    try:
+        tracks = None
+        album_id = find_album(session, album, album_artist)
+        if album_id:
+            status, songs = fetch_all_pages(session, f"/v1/catalog/{country_code}/albums/{album_id}/tracks", page_size=300)
+            if status != 200:
+                raise Exception(f"Error {status} while fetching the tracks of album {album_id}")
+            # Albums may hold music videos too
+            songs = [song for song in songs if song.get('type', 'songs') == 'songs']
+            remember_catalog_songs(songs)
+            remember_track_details(songs)
+            tracks = [catalog_search_result(song) for song in songs]
+    except Exception as e:
+        # Not cached, a later window may try again; the rows fall back to searching
+        print(f"Album lookup failed: {e}")
+        return None
+    
+    with album_tracks_lock:
+        album_tracks_cache[key] = tracks
+    return tracks
+
+def match_album_rows(session, records, executor, window=None):
+    """Match rows against the tracklists of their albums, as {search key: MatchResult}
+    
+    Albums are looked up when enough rows of the window (all rows read ahead, including
+    those matched otherwise) share them, or when an earlier window already resolved them.
+    Rows without a confident match are left to the text search.
+    """
+    window_counts = Counter((record.album, record.album_artist) for record in (records if window is None else window))
+    albums = defaultdict(list)
+    for record in records:
+        if record.album:
+            albums[(record.album, record.album_artist)].append(record)
+    with album_tracks_lock:
+        albums = {
+            key: members for key, members in albums.items()
+            if window_counts[key] >= album_min_tracks or key in album_tracks_cache
+        }
+    
+    matches = {}
+    tracklists = executor.map(lambda key: get_album_tracks(session, *key), albums)
+    for members, tracks in zip(albums.values(), tracklists):
+        for record in members:
+            record_strategy('album', 'tried')
+            scored = rank_candidates(tracks or [], record.title, record.artist, record.album,
+                                     record.duration, record.explicit, record.isrc)
+            if scored and scored[0][0] >= 0.8:
+                record_strategy('album', 'matched')
+                matches[record.search_key] = MatchResult(scored[0][1]['trackId'], scored[0][0], 'album')
+    return matches
+
+def completed_future(result):
+    """A Future that already holds result, to queue rows that need no matching"""
+    future = Future()
+    future.set_result(result)
+    return future
+
+def read_in_chunks(reader, size):
+    """Yield lists of up to size items from an iterator of CSV rows"""
+    chunk = []
+    for row in reader:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+class Journal:
+    """Append-only log of per-row outcomes next to the CSV, used to resume runs
+    
+    Only the offset of each row's latest entry is kept in memory; the entries themselves
+    are read back from the file (see entries), so memory stays flat on large CSVs.
+    """
+    # Rows with these results need no more work; failed writes and lookups are retried
+    done_results = ("OK", "DUPLICATE", "NOT_FOUND")
+    
+    def __init__(self, file, mode, resume=False):
+        self.path = f"{os.path.splitext(file)[0]}_{mode}.journal"
+        self.offsets = {}
+        # Track URI of each row that needs no more work
+        self.done = {}
+        end = self.load() if resume else 0
+        self.file = open(self.path, 'r+b' if end else 'wb')
+        # Drop a line cut short when the run was interrupted, so the next one starts on its own line
+        self.file.truncate(end)
+        self.file.seek(end)
+    
+    def load(self):
+        """Index the latest entry for each row of an earlier run, returning where the valid entries end"""
+        end = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as journal:
+                for line in journal:
+                    if not line.endswith(b'\n'):
+                        break  # A line cut short when the run was interrupted
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        entry = None
+                    if entry:
+                        self.offsets[entry['row']] = end
+                        if self.is_done(entry):
+                            self.done[entry['row']] = entry['track'].get('uri', '')
+                        else:
+                            self.done.pop(entry['row'], None)
+                    end += len(line)
+        return end
+    
+    def done_rows(self):
+        """Map the rows an earlier run finished to their track URI"""
+        return dict(self.done)
+    
+    def is_done(self, entry):
+        return entry['result'] in self.done_results and not entry['track'].get('lookup_errors')
+    
+    def append(self, track, result):
+        """Record the outcome of a row"""
+        track = dict(track)
+        if track.get('alternatives'):
+            track['alternatives'] = [
+                {key: alt[key] for key in ('id', 'name', 'artist', 'confidence')}
+                for alt in track['alternatives']
+            ]
+        entry = {'row': track['row'], 'result': result, 'track': track}
+        self.offsets[entry['row']] = self.file.tell()
+        self.file.write((json.dumps(entry, separators=(',', ':')) + '\n').encode('utf-8'))
+        self.file.flush()
+    
+    def entries(self):
+        """Yield the latest entry of each row, in row order, read back from the file"""
+        with open(self.path, 'rb') as journal:
+            for row in sorted(self.offsets):
+                journal.seek(self.offsets[row])
+                yield json.loads(journal.readline())
+    
+    def close(self):
+        self.file.close()
+
+def match_cache_keys(title, artist, album, album_artist, isrc):
+    """Match cache keys for the ISRC lookup and the text search of a track"""
+    isrc_key = f"isrc:{isrc.upper()}|{album}|{album_artist}" if isrc else None
+    search_key = f"search:{title}|{artist}|{album}"
+    return isrc_key, search_key
+
+class NormalizedTrack:
+    """A CSV row whose fields are normalized once, up front, for every matching step"""
+    __slots__ = ('row', 'uri', 'raw_title', 'raw_artist', 'title', 'artist', 'album', 'album_artist', 'isrc',
+                 'duration', 'explicit', 'catalog_id', 'isrc_key', 'search_key')
+    
+    def __init__(self, index, uri, title, artist, album, album_artist, isrc, duration=None, explicit=None, catalog_id=None):
+        self.row = index
+        self.uri = uri
+        # Sync keys are built from the raw strings, like those of the remote playlist
+        self.raw_title = title
+        self.raw_artist = artist
+        self.title = clean_string(title)
+        self.artist = clean_string(artist)
+        self.album = clean_string(album)
+        self.album_artist = clean_string(album_artist)
+        self.isrc = clean_string(isrc)
+        self.duration = duration
+        self.explicit = explicit
+        # Set for rows of a mapping file: the catalog ID they matched, or '' if none
+        self.catalog_id = catalog_id
+        self.isrc_key, self.search_key = match_cache_keys(self.title, self.artist, self.album, self.album_artist, self.isrc)
+    
+    def as_track(self, **extra):
+        """The per-row dict the writers, journal and report work with"""
+        track = {
+            'row': self.row,
+            'uri': self.uri,
+            'title': self.title,
+            'artist': self.artist,
+            'album': self.album,
+            'album_artist': self.album_artist,
+            'isrc': self.isrc,
+            'duration': self.duration,
+            'explicit': self.explicit,
+            'raw_title': self.raw_title,
+            'raw_artist': self.raw_artist
+        }
+        track.update(extra)
+        return track
+
+def count_csv_rows(path):
+    """Estimate the number of tracks of a CSV from its newlines, without parsing it"""
+    lines = 0
+    last = b'\n'
+    with open(path, 'rb') as csvfile:
+        for block in iter(lambda: csvfile.read(1 << 20), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        lines += 1
+    return max(0, lines - 1)  # Subtract header row
+
+class TrackReader:
+    """Stream the rows of an exported CSV as NormalizedTracks, finding columns by header name"""
+    # Header names of each field, in the order they are looked for (compared case-insensitively)
+    columns = {
+        'uri': ('Track URI', 'Spotify URI', 'URI', 'Spotify ID', 'Track ID'),
+        'title': ('Track Name', 'Track', 'Name', 'Title', 'Song'),
+        'artist': ('Artist Name(s)', 'Artist Name', 'Artists', 'Artist'),
+        'album': ('Album Name', 'Album'),
+        'album_artist': ('Album Artist Name(s)', 'Album Artist Name', 'Album Artist'),
+        'isrc': ('ISRC',),
+        'duration': ('Track Duration (ms)', 'Duration (ms)', 'Duration_ms'),
+        # Durations of other exporters, in seconds or as m:ss
+        'length': ('Duration', 'Length'),
+        'explicit': ('Explicit',),
+        # Written by the match mode (see write_mapping)
+        'catalog_id': ('Apple Music ID',),
+        'match_method': ('Match Method',),
+        'storefront': ('Storefront',),
+    }
+    required = ('title', 'artist')
+    
+    def __init__(self, csvfile):
+        self.reader = csv.reader(csvfile)
+        header_row = [name.strip().lower() for name in next(self.reader, [])]
+        self.positions = {}
+        for field, names in self.columns.items():
+            for name in names:
+                if name.lower() in header_row:
+                    self.positions[field] = header_row.index(name.lower())
+                    break
+        # Number of rows read so far, and of those skipped, included
+        self.rows = 0
+        self.skipped = 0
+    
+    def is_valid(self):
+        return all(field in self.positions for field in self.required)
+    
+    def tracks(self, skip_rows=None):
+        """Yield a NormalizedTrack per row, numbered from 1, leaving out the rows skip_rows
+        maps to their track URI; a row whose URI changed since is read like any other"""
+        skip_rows = skip_rows or {}
+        for index, row in enumerate(self.reader, 1):
+            self.rows = index
+            fields = {
+                field: row[position] if position < len(row) else ''
+                for field, position in self.positions.items()
+            }
+            if index in skip_rows and skip_rows[index] == fields.get('uri', ''):
+                self.skipped += 1
+                continue
+            # Matches of another storefront may not be available in this one
+            catalog_id = None
+            if fields.get('match_method') and fields.get('storefront', country_code).lower() == country_code.lower():
+                catalog_id = fields.get('catalog_id', '')
+            yield NormalizedTrack(
+                index,
+                fields.get('uri', ''),
+                fields['title'],
+                fields['artist'],
+                fields.get('album', ''),
+                # Without an album artist column, the track artist is the best guess
+                fields.get('album_artist') or fields['artist'],
+                fields.get('isrc', ''),
+                parse_duration(fields.get('duration')) if 'duration' in fields else parse_length(fields.get('length')),
+                parse_explicit(fields.get('explicit')),
+                catalog_id
+            )
+
+def parse_duration(value):
+    """Duration in milliseconds of a CSV field, or None"""
+    try:
+        return int(float(value)) if value else None
+    except ValueError:
         return None
 
-def process_songs(file, mode='playlist'):
-    """Process songs with progress bar showing track and artist"""
-    failed_tracks = []
+def parse_length(value):
+    """Duration in milliseconds of a CSV field in seconds or [h:]m:ss, or None"""
+    seconds = 0
+    try:
+        for part in (value or '').strip().split(':'):
+            seconds = seconds * 60 + float(part)
+    except ValueError:
+        return None
+    return int(seconds * 1000) if seconds > 0 else None
+
+def parse_explicit(value):
+    """Whether a CSV field marks a track explicit, or None if it doesn't say"""
+    value = (value or '').strip().lower()
+    if value in ('true', 'yes', '1', 'explicit'):
+        return True
+    if value in ('false', 'no', '0', 'notexplicit', 'clean'):
+        return False
+    return None
+
+def match_track(session, record, isrc_candidates, cached_matches, album_matches=None):
+    """Match a CSV row to an Apple Music catalog ID, trying its ISRC first"""
+    started = time.perf_counter()
+    cpu_started = time.thread_time()
+    network_started = run_metrics.network_time()
+    
+    title, artist, album, album_artist, isrc = record.title, record.artist, record.album, record.album_artist, record.isrc
+    isrc_key, search_key = record.isrc_key, record.search_key
+    track = record.as_track()
+    new_matches = {}
+    
+    # Try ISRC first
+    track_id = None
+    confidence, method = 1, 'isrc'
+    isrc_errors = 0
+    if isrc:
+        record_strategy('isrc', 'tried')
+        if isrc_key in cached_matches:
+            track_id = cached_matches[isrc_key].track_id
+        elif isrc.upper() in isrc_candidates:
+            track_id = select_isrc_match(isrc_candidates[isrc.upper()], album, album_artist)
+            new_matches[isrc_key] = MatchResult(track_id, 1 if track_id else 0, 'isrc')
+        else:
+            # Batches that failed end up here, so a failure is counted against the row
+            try:
+                track_id = match_isrc_to_itunes_id(session, album, album_artist, isrc)
+                new_matches[isrc_key] = MatchResult(track_id, 1 if track_id else 0, 'isrc')
+            except Exception:
+                isrc_errors += 1
+        if track_id:
+            record_strategy('isrc', 'matched')
+    
+    # If ISRC fails, try text search
+    if not track_id:
+        match_result = cached_matches.get(search_key)
+        if match_result is None and album_matches:
+            match_result = album_matches.get(search_key)
+        if match_result is None:
+            match_result = get_itunes_id(title, artist, album, session, record.duration, record.explicit, isrc)
+            if match_result.track_id or not match_result.errors:
+                new_matches[search_key] = match_result
+        if match_result.track_id:
+            track_id = match_result.track_id
+            confidence, method = match_result.confidence, match_result.match_method
+        else:
+            track['alternatives'] = match_result.alternative_matches
+            track['lookup_errors'] = match_result.errors + isrc_errors
+    
+    if match_cache:
+        match_cache.count(hit=not new_matches and (isrc_key in cached_matches or search_key in cached_matches))
+        if new_matches:
+            match_cache.set_many(country_code, new_matches)
+    
+    if track_id:
+        track['confidence'] = round(confidence, 3)
+        track['match_method'] = method
+    
+    run_metrics.record_match(time.perf_counter() - started, time.thread_time() - cpu_started,
+                             run_metrics.network_time() - network_started)
+    return track, track_id
+
+def needs_search(record, isrc_candidates, cached_matches):
+    """Whether a row will be matched by text search, as far as the batched lookups tell"""
+    if record.search_key in cached_matches:
+        return False
+    if not record.isrc:
+        return True
+    if record.isrc_key in cached_matches:
+        return not cached_matches[record.isrc_key].track_id
+    if record.isrc.upper() in isrc_candidates:
+        return not select_isrc_match(isrc_candidates[record.isrc.upper()], record.album, record.album_artist)
+    # Left to the single ISRC lookup, which usually matches
+    return False
+
+class SharedMatches:
+    """Matches of the playlists processed together, so a row they share is matched once"""
+    def __init__(self):
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.reused = 0
+    
+    def key(self, record):
+        return (record.isrc_key, record.search_key)
+    
+    def __contains__(self, record):
+        with self.lock:
+            return self.key(record) in self.futures
+    
+    def submit(self, record, submit):
+        """Return the future of the match of record, calling submit only for the first playlist"""
+        with self.lock:
+            future = self.futures.get(self.key(record))
+            if future is None:
+                future = self.futures[self.key(record)] = submit()
+                return future
+            self.reused += 1
+        run_metrics.record_cache('shared_matches', hit=True)
+        
+        # The other playlist's match, for this playlist's row
+        reused = Future()
+        def resolve(source):
+            try:
+                track, track_id = source.result()
+            except Exception as e:
+                reused.set_exception(e)
+                return
+            extra = {key: track[key] for key in ('alternatives', 'lookup_errors', 'confidence', 'match_method') if key in track}
+            reused.set_result((record.as_track(**extra), track_id))
+        future.add_done_callback(resolve)
+        return reused
+
+def open_session():
+    """Open an HTTP session with the Apple Music headers"""
+    s = make_session()
+    s.headers.update({
+        "Authorization": f"{token}",
+        "media-user-token": f"{media_user_token}",
+        "Cookie": f"{cookies}".encode('utf-8'),
+        "Host": "amp-api.music.apple.com",
+        "Accept-Encoding": "gzip, deflate, br",
+        "Referer": "https://music.apple.com/",
+        "Origin": "https://music.apple.com",
+        "Connection": "keep-alive",
+        "Sec-Fetch-Dest": "empty",
+        "Sec-Fetch-Mode": "cors",
+        "Sec-Fetch-Site": "same-site",
+    })
+    return s
+
+def print_summary(summary, mode):
+    """Print the outcome of a run, with the match strategy and cache statistics"""
+    total_tracks = summary['total']
+    success_rate = ((summary['matched'] + summary['duplicates']) / total_tracks) * 100 if total_tracks > 0 else 0
+    print(f"\n=== Processing Complete ===")
+    if 'playlists' in summary:
+        print(f"Playlists: {summary['playlists']}")
+    print(f"Total tracks: {total_tracks}")
+    print(f"Successfully processed: {summary['matched']}")
+    if summary['duplicates']:
+        print(f"Already in playlist: {summary['duplicates']}")
+    if summary['removed']:
+        print(f"Removed from playlist: {summary['removed']}")
+    print(f"Failed: {summary['failed']}")
+    print(f"Success rate: {success_rate:.1f}%")
+    
+    action_type = {
+        'playlist': 'added to playlist',
+        'sync': 'synced to playlist',
+        'like': 'liked',
+        'library': 'added to library',
+        'match': 'matched only; apply the mapping file(s) with any mode to write them'
+    }[mode]
+    print(f"Tracks were {action_type}")
+    print_strategy_stats()
+    print_memo_stats()
+    if match_cache:
+        print(f"\nMatch cache: {match_cache.hits} hits, {match_cache.misses} misses")
+    if local_catalog and use_local_catalog:
+        print(f"Local catalog: {local_catalog.hits} hits, {local_catalog.misses} misses")
+
+def process_songs(file, mode='playlist', session=None, shared_matches=None, position=None, reset_metrics=True):
+    """Process songs with progress bar showing track and artist
+    
+    Returns a summary of the outcome counts, or None if the CSV can't be read. Given a
+    session, the file is one of several processed together (see process_playlists), and
+    its progress bar is drawn on line position. With reset_metrics false, the run's
+    performance metrics add to those of the runs before it.
+    """
+    standalone = session is None
+    if standalone:
+        strategy_stats.clear()
+        candidate_stats.clear()
+        for memo in lookup_memos:
+            memo.reset_stats()
+        if reset_metrics:
+            run_metrics.reset()
     
     # Prevent sleep on macOS if possible
-    if caffeine_enabled:
+    if caffeine_enabled and standalone:
         caffeine.on(display=True)
     
     try:
-        with requests.Session() as s:
-            s.headers.update({
-                "Authorization": f"{token}",
-                "media-user-token": f"{media_user_token}",
-                "Cookie": f"{cookies}".encode('utf-8'),
-                "Host": "amp-api.music.apple.com",
-                "Accept-Encoding": "gzip, deflate, br",
-                "Referer": "https://music.apple.com/",
-                "Origin": "https://music.apple.com",
-                "Connection": "keep-alive",
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "same-site",
-            })
-            
+        with open_session() if standalone else nullcontext(session) as s:
             playlist_identifier = None
-            playlist_track_ids = []
+            playlist_track_ids = set()
             playlist_name = None
+            playlist_index = None
+            writer = None
             
-            if mode == 'playlist':
+            if mode in ('playlist', 'sync'):
                 playlist_name = os.path.basename(file).split('.')[0].replace('_', ' ').capitalize()
                 print(f"\nCreating playlist: {playlist_name}")
                 playlist_identifier = create_apple_music_playlist(s, playlist_name)
-                playlist_track_ids = get_playlist_track_ids(s, playlist_identifier)
+                if mode == 'sync':
+                    playlist_index = load_playlist_index(s, playlist_identifier)
+                    playlist_track_ids = playlist_index.catalog_ids
+                else:
+                    playlist_track_ids = get_playlist_track_ids(s, playlist_identifier)
+                writer = PlaylistWriter(s, playlist_identifier, playlist_track_ids)
                 print()  # Add a blank line before progress bar
+            elif mode == 'like':
+                writer = LikeWriter(s)
+            elif mode == 'match':
+                writer = MatchOnlyWriter()
+            else:  # library mode
+                writer = LibraryWriter(s)
             
-            # Count total tracks first
-            with open(str(file), encoding='utf-8') as csvfile:
-                total_tracks = sum(1 for row in csv.reader(csvfile)) - 1  # Subtract header row
+            # In sync mode, what the CSV holds decides which remote tracks to keep
+            csv_isrcs = set()
+            csv_keys = set()
+            
+            # The CSV is parsed once, so the total is estimated from its newlines
+            total_tracks = count_csv_rows(str(file))
             
             # Initialize progress bar
             progress = tqdm(
                 total=total_tracks,
                 desc="Starting...",
                 unit="track",
-                bar_format='{desc}: {percentage:3.0f}% |{bar}| {n_fmt}/{total_fmt} (Time remaining: {remaining})'
+                bar_format='{desc}: {percentage:3.0f}% |{bar}| {n_fmt}/{total_fmt} (Time remaining: {remaining}) {postfix}',
+                position=position,
+                leave=standalone
             )
             
-            matched = 0
-            failed = 0
+            journal = Journal(file, mode, resume)
+            done_rows = journal.done_rows()
+            if done_rows:
+                progress.write(f"Resuming: skipping the {len(done_rows)} tracks already done, unless their row changed")
+            
+            def record_outcome(track, result):
+                journal.append(track, result)
             
-            with open(str(file), encoding='utf-8') as csvfile:
-                file_reader = csv.reader(csvfile)
-                header_row = next(file_reader)
+            with open(str(file), encoding='utf-8', newline='') as csvfile:
+                track_reader = TrackReader(csvfile)
                 
-                if header_row[1] != 'Track Name' or header_row[3] != 'Artist Name(s)' or header_row[5] != 'Album Name' or header_row[16] != 'ISRC':
-                    print('\nThe CSV file is not in the correct format!\nPlease be sure to download the CSV file(s) only from https://watsonbox.github.io/exportify/.\n\n')
-                    return
+                if not track_reader.is_valid():
+                    progress.close()
+                    print('\nThe CSV file is not in the correct format!\nIt needs at least a track name and an artist name column.\nPlease be sure to download the CSV file(s) only from https://watsonbox.github.io/exportify/.\n\n')
+                    journal.close()
+                    return None
                 
-                for row in file_reader:
-                    title, artist, album, album_artist, isrc = [clean_string(x) for x in [row[1], row[3], row[5], row[7], row[16]]]
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    # Matches run concurrently but are written strictly in CSV order
+                    in_flight = deque()
                     
-                    # Update progress description with track and artist
-                    track_info = f"{title} by {artist}"
-                    if len(track_info) > 60:  # Truncate if too long
-                        track_info = track_info[:57] + "..."
-                    progress.set_description(track_info)
-                    
-                    # Try ISRC first
-                    track_id = None
-                    if isrc:
-                        track_id = match_isrc_to_itunes_id(s, album, album_artist, isrc)
-                    
-                    # If ISRC fails, try text search
-                    if not track_id:
-                        match_result = get_itunes_id(title, artist, album, s)
-                        if match_result.track_id:
-                            track_id = match_result.track_id
-                    
-                    if track_id:
-                        if mode == 'playlist':
-                            result = add_song_to_playlist(s, track_id, playlist_identifier, playlist_track_ids, playlist_name)
-                        elif mode == 'like':
-                            result = like_track(s, track_id)
-                        else:  # library mode
-                            result = add_to_library(s, track_id)
-                            
-                        if result == "OK":
-                            matched += 1
+                    def write_next():
+                        track, track_id = in_flight.popleft().result()
+                        track['track_id'] = track_id
+                        
+                        if track.get('in_playlist'):
+                            outcomes = writer.add(track, result="DUPLICATE")
+                        elif track_id:
+                            outcomes = writer.add(track, track_id)
                         else:
-                            failed += 1
-                            failed_tracks.append({
-                                'title': title,
-                                'artist': artist,
-                                'album': album,
-                                'isrc': isrc,
-                                'error': 'Failed to process'
-                            })
-                    else:
-                        failed += 1
-                        failed_tracks.append({
-                            'title': title,
-                            'artist': artist,
-                            'album': album,
-                            'isrc': isrc,
-                            'alternatives': match_result.alternative_matches if 'match_result' in locals() else []
-                        })
+                            outcomes = writer.add(track, result="NOT_FOUND")
+                        
+                        for outcome in outcomes:
+                            record_outcome(*outcome)
+                        
+                        # Update progress description with track and artist
+                        track_info = f"{track['title']} by {track['artist']}"
+                        if len(track_info) > 60:  # Truncate if too long
+                            track_info = track_info[:57] + "..."
+                        progress.set_description(track_info, refresh=False)
+                        status = rate_limit_status()
+                        if live_stats:
+                            status += f", {run_metrics.status()}"
+                        progress.set_postfix_str(status, refresh=False)
+                        progress.update(1)
+                    
+                    # Rows finished by an earlier run are skipped when resuming
+                    skipped = 0
+                    for records in read_in_chunks(track_reader.tracks(done_rows), lookahead_rows):
+                        progress.update(track_reader.skipped - skipped)
+                        skipped = track_reader.skipped
+                        # In sync mode, rows the remote playlist already has need no matching
+                        in_playlist = {}
+                        if playlist_index:
+                            for record in records:
+                                key = sync_key(record.raw_title, record.raw_artist)
+                                csv_keys.add(key)
+                                if record.isrc:
+                                    csv_isrcs.add(record.isrc)
+                                if playlist_index.contains(record.isrc, key):
+                                    in_playlist[record.row] = record.as_track(in_playlist=True)
+                        # Rows of a mapping file were matched already
+                        mapped = {
+                            record.row: (record.as_track(), record.catalog_id or None)
+                            for record in records if record.catalog_id is not None and record.row not in in_playlist
+                        }
+                        # Rows another playlist already matches are left to it
+                        to_match = [
+                            record for record in records
+                            if record.row not in in_playlist and record.row not in mapped
+                            and not (shared_matches and record in shared_matches)
+                        ]
+                        
+                        # Resolve the ISRCs of the upcoming rows in a few batched requests
+                        # Earlier runs may already have matched some of them
+                        cached_matches = {}
+                        if match_cache:
+                            cached_matches = match_cache.get_many(country_code, [
+                                key for record in to_match for key in (record.isrc_key, record.search_key) if key
+                            ])
+                        isrc_candidates = fetch_isrc_candidates(s, [
+                            record.isrc for record in to_match if record.isrc_key not in cached_matches
+                        ])
+                        
+                        # Rows their ISRC won't match are matched per album where they share one
+                        album_matches = {}
+                        if album_min_tracks:
+                            album_matches = match_album_rows(s, [
+                                record for record in to_match
+                                if needs_search(record, isrc_candidates, cached_matches)
+                            ], executor, records)
+                        
+                        for record in records:
+                            if record.row in in_playlist:
+                                future = completed_future((in_playlist[record.row], None))
+                            elif record.row in mapped:
+                                future = completed_future(mapped[record.row])
+                            elif shared_matches is not None:
+                                future = shared_matches.submit(record, lambda record=record: executor.submit(
+                                    match_track, s, record, isrc_candidates, cached_matches, album_matches
+                                ))
+                            else:
+                                future = executor.submit(match_track, s, record, isrc_candidates, cached_matches, album_matches)
+                            in_flight.append(future)
+                            while len(in_flight) > workers * 2:
+                                write_next()
+                    progress.update(track_reader.skipped - skipped)
                     
-                    progress.update(1)
-                    sleep(delay)
+                    while in_flight:
+                        write_next()
+                
+                # Quoted fields may hold newlines, so settle on the rows actually read
+                total_tracks = track_reader.rows
+                progress.total = total_tracks
+                progress.refresh()
             
-            progress.close()
+            # Write whatever is left in the last chunk
+            for outcome in writer.flush():
+                record_outcome(*outcome)
             
-            # Generate report
-            success_rate = (matched / total_tracks) * 100 if total_tracks > 0 else 0
-            print(f"\n=== Processing Complete ===")
-            print(f"Total tracks: {total_tracks}")
-            print(f"Successfully processed: {matched}")
-            print(f"Failed: {failed}")
-            print(f"Success rate: {success_rate:.1f}%")
+            if mode == 'match':
+                write_mapping(mapping_path(file), journal.entries())
             
-            action_type = {
-                'playlist': 'added to playlist',
-                'like': 'liked',
-                'library': 'added to library'
-            }[mode]
-            print(f"Tracks were {action_type}")
+            # Generate report from the journal, so resumed runs count earlier rows too
+            matched = 0
+            duplicates = 0
+            failed = 0
+            # The remote track of a row that wasn't matched can't be told apart from one to remove
+            unmatched = 0
+            failed_tracks = []
+            for entry in journal.entries():
+                if entry['result'] == "NOT_FOUND" or entry['track'].get('lookup_errors'):
+                    unmatched += 1
+                if entry['result'] == "OK":
+                    matched += 1
+                    continue
+                if entry['result'] == "DUPLICATE":
+                    duplicates += 1
+                    continue
+                failed += 1
+                if entry['result'] == "NOT_FOUND":
+                    failed_tracks.append(entry['track'])
+                else:
+                    failed_tracks.append({**entry['track'], 'error': 'Failed to process'})
+            
+            removed = 0
+            if playlist_index and remove_missing and not playlist_index.complete:
+                print("\nNot removing any tracks: the details of some playlist tracks could not be looked up")
+            elif playlist_index and remove_missing and unmatched:
+                print(f"\nNot removing any tracks: {unmatched} tracks of the CSV were not matched, "
+                      f"so their playlist tracks can't be told apart from removed ones")
+            elif playlist_index and remove_missing:
+                # Rows skipped on resume were not read, so their tracks are kept too
+                csv_catalog_ids = set()
+                for entry in journal.entries():
+                    if entry['track'].get('isrc'):
+                        csv_isrcs.add(entry['track']['isrc'])
+                    csv_keys.add(sync_key(entry['track'].get('raw_title', entry['track']['title']),
+                                          entry['track'].get('raw_artist', entry['track']['artist'])))
+                    # Tracks matched to what the playlist holds are kept however they are spelled
+                    if entry['result'] in ("OK", "DUPLICATE"):
+                        csv_catalog_ids.update(
+                            str(entry['track'][key]) for key in ('track_id', 'equivalent_id') if entry['track'].get(key)
+                        )
+                removed = remove_playlist_tracks(s, playlist_identifier, playlist_index.library_ids_missing_from(
+                    csv_isrcs, csv_keys, csv_catalog_ids
+                ))
+            
+            progress.close()
+            journal.close()
+            
+            summary = {
+                'file': file,
+                'total': total_tracks,
+                'matched': matched,
+                'duplicates': duplicates,
+                'removed': removed,
+                'failed': failed
+            }
+            if standalone:
+                print_summary(summary, mode)
+            else:
+                print(f"\nFinished {os.path.basename(file)}: {matched + duplicates}/{total_tracks} processed, {failed} failed")
             
             if failed_tracks:
                 report_filename = f"{os.path.splitext(file)[0]}_failed_tracks.html"
                 write_error_report(report_filename, failed_tracks)
                 print(f"\nGenerated error report: {report_filename}")
+            if mode == 'match':
+                print(f"\nMapping file: {mapping_path(file)}")
+            return summary
     
     finally:
         # Re-enable sleep if we disabled it
+        if caffeine_enabled and standalone:
+            caffeine.off()
+
+def csv_files(directory, mode):
+    """The CSV files of a directory to process in a mode
+    
+    A mapping file stands in for its CSV while it is up to date, that is newer than the CSV.
+    Otherwise the CSV is used, and its stale mapping is left out.
+    """
+    files = [os.path.join(directory, f) for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f)) and f.endswith('.csv')]
+    mappings = {f for f in files if f.endswith('.mapping.csv')}
+    exports = [f for f in files if f not in mappings]
+    if mode == 'match':
+        return exports
+    current = {
+        f: mapping_path(f) for f in exports
+        if mapping_path(f) in mappings and os.path.getmtime(mapping_path(f)) >= os.path.getmtime(f)
+    }
+    # Mappings whose CSV is gone can still be applied
+    orphans = [f for f in mappings if f[:-len('.mapping.csv')] + '.csv' not in exports]
+    return [current.get(f, f) for f in exports] + orphans
+
+def process_playlists(files, mode='playlist', reset_metrics=True):
+    """Process several CSV files at once over one session and one rate budget
+    
+    Rows that appear in more than one file are matched once. Each file still gets its own
+    journal and error report; the summary printed at the end covers all of them.
+    """
+    strategy_stats.clear()
+    candidate_stats.clear()
+    for memo in lookup_memos:
+        memo.reset_stats()
+    if reset_metrics:
+        run_metrics.reset()
+    shared_matches = SharedMatches()
+    
+    # Prevent sleep on macOS if possible
+    if caffeine_enabled:
+        caffeine.on(display=True)
+    
+    # Each file being processed draws its progress bar on a line of its own
+    concurrent_files = max(1, min(parallel_playlists, len(files)))
+    positions = queue.Queue()
+    for position in range(concurrent_files):
+        positions.put(position)
+    
+    def process(file):
+        position = positions.get()
+        try:
+            return process_songs(file, mode, s, shared_matches, position)
+        finally:
+            positions.put(position)
+    
+    try:
+        # Printed lines go above the progress bars instead of through them
+        with open_session() as s, redirect_stdout(DummyTqdmFile(sys.stdout)):
+            with ThreadPoolExecutor(max_workers=concurrent_files) as executor:
+                summaries = list(executor.map(process, files))
+    finally:
         if caffeine_enabled:
             caffeine.off()
+    
+    summaries = [summary for summary in summaries if summary]
+    combined = {key: sum(summary[key] for summary in summaries) for key in ('total', 'matched', 'duplicates', 'removed', 'failed')}
+    combined['playlists'] = len(summaries)
+    print_summary(combined, mode)
+    if shared_matches.reused:
+        print(f"Rows shared between playlists: {shared_matches.reused} matched once and reused")
+    return combined
 
 if __name__ == "__main__":
+    # Checking if the command is correct
+    if len(argv) > 1 and argv[1]:
+        pass
+    else:
+        print('\nCommand usage:\npython3 convert.py yourplaylist.csv\nMore info at https://github.com/delorfin/spotify-to-apple-music')
+        exit()
+    
+    parser = argparse.ArgumentParser(
+        description="Import Spotify playlists exported with Exportify into Apple Music",
+        epilog="More info at https://github.com/delorfin/spotify-to-apple-music"
+    )
+    parser.add_argument('path', help="an Exportify CSV file, or a directory of them")
+    parser.add_argument('--workers', type=int, default=workers,
+                        help=f"number of tracks matched concurrently (default: {workers})")
+    parser.add_argument('--engine', choices=['requests', 'async'], default=engine,
+                        help="HTTP client; 'async' pools connections over HTTP/2 and needs httpx")
+    parser.add_argument('--parallel-playlists', type=int, default=parallel_playlists,
+                        help=f"number of CSV files of a directory processed at once (default: {parallel_playlists})")
+    parser.add_argument('--modes', type=lambda value: value.split(','), metavar='MODE[,MODE...]',
+                        help="run these modes (playlist, like, library, sync, match) instead of asking; "
+                             "with several, tracks are matched once and the matches applied in each")
+    parser.add_argument('--remove-missing', action='store_true',
+                        help="in sync mode, also remove playlist tracks that are no longer in the CSV")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue an interrupted run, skipping the tracks it already finished")
+    parser.add_argument('--no-cache', action='store_true',
+                        help=f"ignore and don't update the on-disk lookup cache ({cache_file})")
+    parser.add_argument('--chunk-size', type=int, default=playlist_chunk_size,
+                        help=f"number of songs added to a playlist or the library per request (default: {playlist_chunk_size})")
+    parser.add_argument('--local-catalog', action='store_true',
+                        help="match from the catalog songs seen in earlier runs first, searching only on a miss")
+    parser.add_argument('--import-catalog', metavar='FILE',
+                        help="add a JSON dump of catalog songs to the local catalog (implies --local-catalog)")
+    parser.add_argument('--complete-catalog', action='store_true',
+                        help="the --import-catalog dump holds every song of its ISRCs in your storefront, "
+                             "so their ISRC lookups are answered from it")
+    parser.add_argument('--report', metavar='FILE',
+                        help="write request, cache and timing statistics of the run to FILE (.json or .csv)")
+    parser.add_argument('--live-stats', action='store_true',
+                        help="show request counts and latency in the progress bar")
+    parser.add_argument('--duration-tolerance', type=float, default=duration_tolerance_ms / 1000, metavar='SECONDS',
+                        help="reject search results whose duration differs from the CSV's by more than this (0 to disable)")
+    parser.add_argument('--album-min-tracks', type=int, default=album_min_tracks,
+                        help="rows of one album within the lookahead from which the album's tracklist is fetched and matched against, instead of searching each row (0 to disable)")
+    parser.add_argument('--search-backend', choices=['catalog', 'itunes'], default=search_backend,
+                        help="text search: the authenticated catalog search (falls back to iTunes), or the public iTunes Search API")
+    parser.add_argument('--similarity', choices=['auto', *similarity_scorers], default=similarity_backend,
+                        help="string similarity backend (default: difflib); rapidfuzz is much faster but "
+                             "scores up to about 0.07 higher, 'auto' uses it when it is installed")
+    args = parser.parse_args()
+    mode_map = {'1': 'playlist', '2': 'like', '3': 'library', '4': 'sync', '5': 'match'}
+    if args.modes and not set(args.modes) <= set(mode_map.values()):
+        parser.error(f"--modes takes a comma-separated list of {', '.join(mode_map.values())}")
+    workers = max(1, args.workers)
+    parallel_playlists = max(1, args.parallel_playlists)
+    engine = args.engine
+    search_backend = args.search_backend
+    album_min_tracks = args.album_min_tracks
+    duration_tolerance_ms = int(args.duration_tolerance * 1000)
+    resume = args.resume
+    remove_missing = args.remove_missing
+    playlist_chunk_size = library_chunk_size = max(1, args.chunk_size)
+    similarity_backend = args.similarity
+    use_local_catalog = args.local_catalog or bool(args.import_catalog)
+    live_stats = args.live_stats
+    if similarity_backend == 'rapidfuzz' and not rapidfuzz_available:
+        print("Note: Install 'rapidfuzz' for faster matching, falling back to difflib:")
+        print("pip install rapidfuzz")
+    
     # Get user tokens and connection data
     token = get_connection_data("token.dat", "\nPlease enter your Apple Music Authorization (Bearer token):\n")
     media_user_token = get_connection_data("media_user_token.dat", "\nPlease enter your media user token:\n")
     cookies = get_connection_data("cookies.dat", "\nPlease enter your cookies:\n")
     country_code = get_connection_data("country_code.dat", "\nPlease enter the country code (e.g., DE, UK, US etc.): ")
+    if args.no_cache:
+        print("\nCache disabled: every track will be looked up again")
+    else:
+        equivalence_cache = EquivalenceCache(cache_file, equivalents_cache_ttl, equivalents_cache_max_entries)
+        match_cache = MatchCache(cache_file, match_cache_ttl, negative_match_cache_ttl, match_cache_max_entries)
+        local_catalog = LocalCatalog(cache_file, local_catalog_ttl, local_catalog_max_songs)
+        if args.import_catalog:
+            imported = import_catalog(args.import_catalog, args.complete_catalog)
+            print(f"\nImported {imported} catalog songs from {args.import_catalog}")
     
     # Show initial message about sleep prevention
     if platform.system() == 'Darwin' and not caffeine_enabled:
@@ -746,24 +2990,43 @@ if __name__ == "__main__":
         print("pip install caffeine\n")
 
     # Ask user for mode
-    while True:
-        print("\nChoose operation mode:")
-        print("1) Create a playlist")
-        print("2) Like all tracks")
-        print("3) Add tracks to library")
-        mode = input("Enter 1, 2, or 3: ").strip()
-        if mode in ['1', '2', '3']:
-            break
-        print("Invalid input. Please enter 1, 2, or 3.")
+    if args.modes:
+        modes = list(dict.fromkeys(args.modes))
+    else:
+        while True:
+            print("\nChoose operation mode:")
+            print("1) Create a playlist")
+            print("2) Like all tracks")
+            print("3) Add tracks to library")
+            print("4) Sync a playlist (only add tracks it doesn't have yet)")
+            print("5) Only match tracks (write a mapping file to convert later, without matching again)")
+            mode = input("Enter 1, 2, 3, 4, or 5: ").strip()
+            if mode in mode_map:
+                break
+            print("Invalid input. Please enter 1, 2, 3, 4, or 5.")
+        modes = [mode_map[mode]]
     
-    mode_map = {'1': 'playlist', '2': 'like', '3': 'library'}
-    mode = mode_map[mode]
-
-    if len(argv) > 1 and argv[1]:
-        if ".csv" in argv[1]:
-            process_songs(argv[1], mode)
+    # Several modes: match once, then apply the mapping file in each of them
+    if len(modes) > 1 and 'match' not in modes and not args.path.endswith('.mapping.csv'):
+        modes.insert(0, 'match')
+    
+    # The performance report covers every mode of the run
+    matched = False
+    for i, mode in enumerate(modes):
+        if ".csv" in args.path:
+            summary = process_songs(mapping_path(args.path) if matched else args.path, mode, reset_metrics=i == 0)
         else:
             # Process all CSV files in directory
-            files = [f for f in os.listdir(argv[1]) if os.path.isfile(os.path.join(argv[1], f)) and f.endswith('.csv')]
-            for file in files:
-                process_songs(os.path.join(argv[1], file), mode)
\ No newline at end of file
+            summary = process_playlists(csv_files(args.path, mode), mode, reset_metrics=i == 0)
+        if summary is None:
+            # The CSV couldn't be read, so there is no mapping file for the modes after it either
+            break
+        matched = matched or mode == 'match'
+    
+    if args.report:
+        run_metrics.write_report(args.report)
+        print(f"\nPerformance report: {args.report}")
+    
+    for cache in (equivalence_cache, match_cache, local_catalog):
+        if cache:
+            cache.close()
\ No newline at end of file